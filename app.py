@@ -1,14 +1,36 @@
+import atexit
+import bisect
+import csv
+import hashlib
+import importlib.util
+import io
+import json
+import math
+import mimetypes
 import os
+import queue
+import re
+import shutil
 import sqlite3
-from datetime import datetime
+import string
+import tempfile
+import threading
+import time
+import unicodedata
+import zipfile
+import zlib
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from functools import lru_cache, wraps
 from io import BytesIO
 from typing import List, Dict
 
+import click
 from flask import (
-    Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
+    Flask, render_template, request, redirect, url_for, flash, send_file, jsonify,
+    Response, g, make_response, stream_with_context,
 )
 
-from docx import Document
 
 # =====================================================
 # CONFIG
@@ -17,7 +39,7 @@ APP_NAME = "EthosJus"
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-ethosjus-secret-final-v1")
 
-DATA_DIR = os.path.abspath("./data")
+DATA_DIR = os.path.abspath(os.environ.get("ETHOSJUS_DATA_DIR", "./data"))
 os.makedirs(DATA_DIR, exist_ok=True)
 DB_PATH = os.path.join(DATA_DIR, "ethosjus.sqlite3")
 
@@ -30,52 +52,6 @@ LINKS_OFICIAIS = {
     "estatuto_oab_8906": "https://www.planalto.gov.br/ccivil_03/leis/l8906.htm",
 }
 
-# =====================================================
-# PERGUNTAS RÁPIDAS (EXPANDIDA)
-# =====================================================
-QUICK_QUESTIONS: List[Dict[str, str]] = [
-    # --- Publicidade / Marketing Digital ---
-    {"text": "Posso impulsionar post no Instagram?", "tag": "Publicidade"},
-    {"text": "Posso divulgar valores e promoções?", "tag": "Publicidade"},
-    {"text": "Posso prometer resultado ou usar 'garantia'?", "tag": "Publicidade"},
-    {"text": "Posso postar fotos com clientes ou processos?", "tag": "Publicidade"},
-    {"text": "Posso anunciar 'especialista'?", "tag": "Publicidade"},
-    {"text": "Posso responder caixinha de perguntas com caso real?", "tag": "Publicidade"},
-    {"text": "Posso fazer sorteio de brindes ou serviços?", "tag": "Publicidade"},
-    {"text": "Posso usar Google Ads (Links Patrocinados)?", "tag": "Publicidade"},
-    {"text": "Posso enviar e-mail marketing ou mala direta?", "tag": "Publicidade"},
-    {"text": "Posso usar logotipos de Tribunais no meu cartão?", "tag": "Publicidade"},
-
-    # --- Sigilo / Dados / LGPD ---
-    {"text": "Posso falar do caso com familiares do cliente?", "tag": "Sigilo"},
-    {"text": "Posso confirmar que a pessoa é minha cliente?", "tag": "Sigilo"},
-    {"text": "Como lidar com documentos sensíveis e LGPD?", "tag": "LGPD"},
-    {"text": "Posso gravar reunião com cliente?", "tag": "LGPD"},
-
-    # --- Honorários / Financeiro ---
-    {"text": "Preciso de contrato de honorários por escrito?", "tag": "Honorários"},
-    {"text": "Posso cobrar consulta? Como formalizar?", "tag": "Honorários"},
-    {"text": "Como combinar êxito (quota litis) sem abusos?", "tag": "Honorários"},
-    {"text": "O que fazer com inadimplência sem expor o cliente?", "tag": "Honorários"},
-    {"text": "Posso reter documentos por falta de pagamento?", "tag": "Honorários"},
-    {"text": "Posso cobrar abaixo da tabela da OAB?", "tag": "Honorários"},
-    {"text": "Posso aceitar bens como pagamento?", "tag": "Honorários"},
-
-    # --- Conflito / Ética / Sociedade ---
-    {"text": "Posso atuar contra ex-cliente?", "tag": "Conflito"},
-    {"text": "Posso representar duas partes relacionadas?", "tag": "Conflito"},
-    {"text": "Quando devo recusar patrocínio?", "tag": "Ética"},
-    {"text": "Posso substabelecer sem avisar?", "tag": "Ética"},
-    {"text": "Posso ter sociedade com contador ou médico?", "tag": "Sociedade"},
-    {"text": "Advogado pode ser preposto do cliente?", "tag": "Ética"},
-
-    # --- Prerrogativas / Atuação ---
-    {"text": "Posso falar mal de outro advogado publicamente?", "tag": "Postura"},
-    {"text": "Como agir em audiência com urbanidade?", "tag": "Postura"},
-    {"text": "Posso atuar sem procuração em urgência?", "tag": "Prerrogativa"},
-    {"text": "O que fazer se o cliente 'sumir'?", "tag": "Gestão"},
-]
-
 # =====================================================
 # HELPERS DE RESPOSTA (HTML)
 # =====================================================
@@ -99,207 +75,416 @@ def _make_answer(title: str, bullets: List[str], delicate: bool = True) -> str:
     </div>
     """
 
+RESPOSTA_GERAL = _make_answer(
+    "Guia ético (resposta geral)",
+    [
+        "Essa dúvida depende do contexto e da normativa aplicável.",
+        "Use a regra do ‘mínimo necessário’, moderação na comunicação e proteção de confidencialidade.",
+        "Quando houver risco ético, consulte o TED/OAB e a normativa aplicável."
+    ],
+    delicate=True
+)
+
+# =====================================================
+# NORMALIZAÇÃO DE TEXTO (BUSCA APROXIMADA)
+# =====================================================
+# Perguntas com acento, caixa, pontuação ou redação diferentes das da base
+# são comparadas pelos termos normalizados: sem acento, sem stopwords e com
+# radicalização leve.
+_STOPWORDS = frozenset("""
+    a ao aos as até com como da das de do dos e é ela ele em entre essa esse
+    esta este eu isso já lhe mais mas me meu meus minha minhas na nas no nos
+    o os ou para pela pelas pelo pelos por qual quando que se sem ser seu
+    seus sua suas só também te tem ter um uma umas uns
+    posso pode podem devo deve preciso precisa permitido
+""".split())
+
+# Sufixos, do mais longo para o mais curto (já sem acento).
+_SUFFIXES = (
+    "amente", "mente", "amento", "imento", "acoes", "icoes", "acao", "icao",
+    "ancias", "ancia", "encias", "encia", "adores", "ador", "ando", "endo",
+    "indo", "ados", "adas", "idos", "idas", "ado", "ada", "ido", "ida",
+    "oes", "ais", "eis", "al", "ar", "er", "ir", "as", "es", "os", "a", "e", "o", "s",
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def _stem(word: str) -> str:
+    # Duas passadas: "familiares" -> "familiar" -> "famili" <- "familia".
+    for _ in range(2):
+        for suf in _SUFFIXES:
+            if word.endswith(suf) and len(word) - len(suf) >= 3:
+                word = word[:-len(suf)]
+                break
+    return word
+
+def _terms(text: str) -> List[str]:
+    # "e-mail" e "ex-cliente" viram uma palavra só.
+    words = _TOKEN_RE.findall(_fold(text).replace("-", ""))
+    return [_stem(w) for w in words if w not in _STOPWORDS]
+
+# =====================================================
+# MÉTRICAS (PROMETHEUS)
 # =====================================================
-# RESPOSTAS PRONTAS
-# =====================================================
-RESPOSTAS_DB: Dict[str, str] = {
-    # --- Publicidade ---
-    "Posso impulsionar post no Instagram?": _make_answer(
-        "Pode, com cuidado (Provimento 205/2021).",
-        [
-            "Em geral, é permitido impulsionar conteúdo informativo, sem oferta direta de serviços.",
-            "Evite promessas, comparações, autopromoção agressiva e captação indevida.",
-            "Priorize conteúdo educativo (direitos, prazos, orientações gerais) sem chamadas do tipo ‘contrate agora’.",
-            "Quando em dúvida, consulte o Provimento 205/2021 e orientações do TED da sua seccional."
-        ]
-    ),
-    "Posso divulgar valores e promoções?": _make_answer(
-        "Regra prática: evite apelo comercial.",
-        [
-            "“Promoção”, ‘desconto’, ‘pacote’ e linguagem mercantil tendem a ser problemáticos.",
-            "Se precisar informar valores, prefira informar em contato privado e com sobriedade.",
-            "Evite comparações (‘mais barato’, ‘melhor do que’)."
-        ]
-    ),
-    "Posso prometer resultado ou usar 'garantia'?": _make_answer(
-        "Não é recomendado — risco ético alto.",
-        [
-            "Promessa de resultado pode configurar publicidade irregular e ferir deveres de moderação.",
-            "Use linguagem de meios, não de fins: explique etapas, riscos e variáveis do caso.",
-            "Evite frases absolutas (‘ganho certo’, ‘causa ganha’)."
-        ]
-    ),
-    "Posso postar fotos com clientes ou processos?": _make_answer(
-        "Só com extrema cautela — e em muitos casos é melhor evitar.",
-        [
-            "Pode violar sigilo, privacidade e gerar captação indevida.",
-            "Evite prints, nomes, números de processo, documentos, peças e decisões com elementos identificáveis.",
-            "Prefira conteúdo genérico: ‘tese X’, ‘tema Y’, sem caso real."
-        ]
-    ),
-    "Posso anunciar 'especialista'?": _make_answer(
-        "Use apenas se houver titulação/critério compatível e comunicação sóbria.",
-        [
-            "Evite títulos chamativos e qualificações vagas (‘o melhor’, ‘o mais renomado’).",
-            "Prefira: área de atuação e formação real, sem induzir o público a erro."
-        ]
-    ),
-    "Posso responder caixinha de perguntas com caso real?": _make_answer(
-        "Evite. Transforme em exemplo abstrato.",
-        [
-            "Mesmo sem nome, detalhes podem identificar a pessoa.",
-            "Responda em tese: explique regras gerais, limites e caminhos típicos.",
-            "Inclua aviso: não é consulta; caso concreto exige análise."
-        ]
-    ),
-    "Posso fazer sorteio de brindes ou serviços?": _make_answer(
-        "Não. É vedado expressamente.",
-        [
-            "A advocacia não pode ser mercantilizada.",
-            "Sorteios, brindes e oferta de serviços gratuitos para captar clientela tendem a ser infrações éticas.",
-            "O foco deve ser conteúdo informativo e competência técnica."
-        ]
-    ),
-    "Posso usar Google Ads (Links Patrocinados)?": _make_answer(
-        "Em regra, é admitido com moderação (Provimento 205/2021).",
-        [
-            "Mantenha caráter informativo e linguagem sóbria.",
-            "Evite ‘consulta grátis’, ‘melhor preço’ e promessas.",
-            "Atenção à captação indevida e mercantilização."
-        ]
-    ),
-    "Posso enviar e-mail marketing ou mala direta?": _make_answer(
-        "Somente com consentimento e para base própria.",
-        [
-            "Evite disparos para listas desconhecidas (risco de spam/captação).",
-            "Prefira boletins informativos para contatos que autorizaram.",
-            "Inclua possibilidade de descadastro."
-        ]
-    ),
-    "Posso usar logotipos de Tribunais no meu cartão?": _make_answer(
-        "Não. Evite símbolos oficiais.",
-        [
-            "Pode induzir a erro sobre vínculo com órgão público.",
-            "Use apenas identidade visual própria.",
-        ]
-    ),
-
-    # --- Sigilo/LGPD ---
-    "Posso falar do caso com familiares do cliente?": _make_answer(
-        "Não, sem autorização expressa e limites claros.",
-        [
-            "A regra é confidencialidade.",
-            "Se o cliente autorizar, delimite: quem, assunto e finalidade.",
-            "Compartilhe o mínimo necessário."
-        ]
-    ),
-    "Posso confirmar que a pessoa é minha cliente?": _make_answer(
-        "Evite — o próprio vínculo pode ser sensível.",
-        [
-            "Resposta padrão segura: ‘Não posso confirmar nem negar informações de atendimento/contratação’.",
-            "Exceções devem ser justificadas e, quando possível, autorizadas por escrito."
-        ]
-    ),
-    "Como lidar com documentos sensíveis e LGPD?": _make_answer(
-        "Mínimo necessário + controle de acesso.",
-        [
-            "Guarde só o necessário para o serviço.",
-            "Senha forte, 2FA, backup e descarte seguro.",
-            "Defina política de acesso e retenção."
-        ]
-    ),
-    "Posso gravar reunião com cliente?": _make_answer(
-        "Boa prática: só com consentimento e finalidade definida.",
-        [
-            "Explique motivo e onde ficará armazenado.",
-            "Evite gravação por padrão; prefira ata.",
-            "Se o cliente não quiser, não grave."
-        ]
-    ),
-
-    # --- Honorários ---
-    "Preciso de contrato de honorários por escrito?": _make_answer(
-        "Altamente recomendado.",
-        [
-            "Defina escopo, honorários, despesas, pagamentos e rescisão.",
-            "Deixe claro o que é extra (recursos, diligências).",
-            "Guarde assinado (inclusive eletrônico)."
-        ]
-    ),
-    "Posso cobrar consulta? Como formalizar?": _make_answer(
-        "Pode — e registre por escrito.",
-        [
-            "Informe valor e o que será entregue.",
-            "Registre por WhatsApp/e-mail e formalize se virar patrocínio.",
-            "Evite promessas de resultado."
-        ]
-    ),
-    "Como combinar êxito (quota litis) sem abusos?": _make_answer(
-        "Transparência e moderação.",
-        [
-            "Explique base de cálculo e quando incide.",
-            "Evite percentuais desproporcionais.",
-            "Deixe claro custas e sucumbência."
-        ]
-    ),
-    "O que fazer com inadimplência sem expor o cliente?": _make_answer(
-        "Negocie e documente; sem exposição.",
-        [
-            "Tente parcelar e ajustar datas.",
-            "Formalize encerramento se necessário.",
-            "Proteja prazos e entregue documentos essenciais."
-        ]
-    ),
-    "Posso reter documentos por falta de pagamento?": _make_answer(
-        "Evite — risco ético alto.",
-        [
-            "Cobrança deve ser feita por meios próprios, sem coação.",
-            "Em dúvida, consulte o TED/OAB."
-        ]
-    ),
-    "Posso cobrar abaixo da tabela da OAB?": _make_answer(
-        "Cuidado com aviltamento.",
-        [
-            "Valores irrisórios podem caracterizar aviltamento e captação.",
-            "Pro bono tem regras e não pode ser usado como publicidade.",
-            "Mantenha dignidade e justificativa."
-        ]
-    ),
-    "Posso aceitar bens como pagamento?": _make_answer(
-        "Em regra, sim — com cautela.",
-        [
-            "Registre no contrato e avalie compatibilidade do valor.",
-            "Evite vulnerabilidade/lesão do cliente.",
-        ]
-    ),
+# Cada processo acumula contadores e histogramas em memória e, no máximo uma
+# vez por METRICS_FLUSH_S, grava um snapshot em data/metrics/<pid>.json.
+# GET /metrics soma os snapshots de todos os workers do gunicorn.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+METRICS_FLUSH_S = 1.0
+METRICS_PREFIX = "ethosjus_"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5, 1.0, 5.0)
+BYTES_BUCKETS = (10_000, 25_000, 50_000, 100_000, 250_000, 1_000_000)
+
+METRICS_HELP = {
+    "http_request_duration_seconds": ("histogram", "Latência das requisições por rota."),
+    "sql_statement_duration_seconds": ("histogram", "Tempo de execução por comando SQL."),
+    "sql_lock_errors_total": ("counter", "Comandos SQL que falharam por lock (busy_timeout estourado)."),
+    "docx_build_duration_seconds": ("histogram", "Tempo de montagem de DOCX (cache miss)."),
+    "docx_bytes": ("histogram", "Tamanho dos DOCX montados."),
+    "docx_cache_total": ("counter", "Consultas ao cache de DOCX por resultado."),
+    "answers_total": ("counter", "Respostas por tipo de casamento (exact, fuzzy, miss)."),
 }
 
-def generate_answer_for_question(q: str) -> str:
-    q = (q or "").strip()
-    if q in RESPOSTAS_DB:
-        return RESPOSTAS_DB[q]
-    return _make_answer(
-        "Guia ético (resposta geral)",
-        [
-            "Essa dúvida depende do contexto e da normativa aplicável.",
-            "Use a regra do ‘mínimo necessário’, moderação na comunicação e proteção de confidencialidade.",
-            "Quando houver risco ético, consulte o TED/OAB e a normativa aplicável."
-        ],
-        delicate=True
-    )
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._flushed = 0.0
+
+    def _state(self):
+        # Depois do fork o processo filho começa do zero (nada do master).
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.counters: Dict[tuple, float] = {}
+            self.histograms: Dict[tuple, list] = {}
+            self.buckets: Dict[str, tuple] = {}
+            self._flushed = time.monotonic()
+            atexit.register(self.flush)
+        return self
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            st = self._state()
+            key = (name, labels)
+            st.counters[key] = st.counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float, buckets: tuple):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            st = self._state()
+            st.buckets[name] = buckets
+            key = (name, labels)
+            h = st.histograms.get(key)
+            if h is None:
+                # Contagem por faixa; a última posição é o excedente (+Inf).
+                h = st.histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            h[0][bisect.bisect_left(buckets, value)] += 1
+            h[1] += value
+            h[2] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            st = self._state()
+            return {
+                "counters": [[n, list(l), v] for (n, l), v in st.counters.items()],
+                "histograms": [[n, list(l), list(h[0]), h[1], h[2]] for (n, l), h in st.histograms.items()],
+                "buckets": {n: list(b) for n, b in st.buckets.items()},
+            }
+
+    def maybe_flush(self):
+        # Chamado no caminho das requisições: falha de métrica nunca vira 500,
+        # e se outra thread já está gravando, esta segue sem esperar.
+        if not METRICS_ENABLED or time.monotonic() - self._flushed < METRICS_FLUSH_S:
+            return
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._flush()
+        except OSError:
+            app.logger.exception("metrics: falha ao gravar o snapshot")
+        finally:
+            self._flush_lock.release()
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        # Sempre sob _flush_lock: o .tmp é um só por processo.
+        if not METRICS_ENABLED or self._pid != os.getpid():
+            return
+        self._flushed = time.monotonic()
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+metrics = Metrics()
+
+def _prom_labels(labels) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+# Snapshots de workers que já saíram são somados em archived.json (pelo
+# child_exit do gunicorn): os contadores continuam monótonos e um pid
+# reaproveitado começa do zero. Quem soma os arquivos segura .lock
+# compartilhado; quem arquiva, exclusivo — a soma nunca vê o snapshot do
+# worker nos dois lugares nem em nenhum.
+METRICS_ARCHIVE = "archived.json"
+
+class _MetricsLock:
+    def __init__(self, exclusive: bool):
+        self.exclusive = exclusive
+
+    def __enter__(self):
+        try:
+            import fcntl  # só POSIX (como o gunicorn); sem ele, sem lock
+        except ImportError:
+            self.f = None
+            return self
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        self.f = open(os.path.join(METRICS_DIR, ".lock"), "a")
+        fcntl.flock(self.f, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, *exc):
+        if self.f is not None:
+            self.f.close()  # fechar solta o flock
+
+def _load_snapshot(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _merge_snapshot(counters: dict, hists: dict, buckets: dict, snap: dict):
+    buckets.update(snap["buckets"])
+    for n, labels, v in snap["counters"]:
+        key = (n, tuple(tuple(l) for l in labels))
+        counters[key] = counters.get(key, 0) + v
+    for n, labels, counts, total, count in snap["histograms"]:
+        key = (n, tuple(tuple(l) for l in labels))
+        h = hists.setdefault(key, [[0] * len(counts), 0.0, 0])
+        h[0] = [a + b for a, b in zip(h[0], counts)]
+        h[1] += total
+        h[2] += count
+
+def archive_worker_metrics(pid: int):
+    """Soma o snapshot de um worker que saiu a archived.json e apaga o dele."""
+    path = os.path.join(METRICS_DIR, f"{pid}.json")
+    archive = os.path.join(METRICS_DIR, METRICS_ARCHIVE)
+    with _MetricsLock(exclusive=True):
+        snap = _load_snapshot(path)
+        if snap is None:
+            return
+        counters, hists, buckets = {}, {}, {}
+        for s in (_load_snapshot(archive), snap):
+            if s:
+                _merge_snapshot(counters, hists, buckets, s)
+        with open(archive + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "counters": [[n, list(l), v] for (n, l), v in counters.items()],
+                "histograms": [[n, list(l), h[0], h[1], h[2]] for (n, l), h in hists.items()],
+                "buckets": buckets,
+            }, f)
+        os.replace(archive + ".tmp", archive)
+        os.remove(path)
+
+def reset_metrics():
+    """Apaga os snapshots (início do servidor: contadores voltam a zero)."""
+    for name in os.listdir(METRICS_DIR) if os.path.isdir(METRICS_DIR) else []:
+        if name.endswith((".json", ".tmp")):
+            os.remove(os.path.join(METRICS_DIR, name))
+
+def render_metrics() -> str:
+    """Soma os snapshots de todos os processos no formato texto do Prometheus."""
+    try:
+        metrics.flush()
+    except OSError:
+        app.logger.exception("metrics: falha ao gravar o snapshot")
+    counters: Dict[tuple, float] = {}
+    hists: Dict[tuple, list] = {}
+    buckets: Dict[str, list] = {}
+    with _MetricsLock(exclusive=False):
+        for name in os.listdir(METRICS_DIR) if os.path.isdir(METRICS_DIR) else []:
+            if not name.endswith(".json"):
+                continue
+            snap = _load_snapshot(os.path.join(METRICS_DIR, name))
+            if snap is not None:
+                _merge_snapshot(counters, hists, buckets, snap)
+    lines = []
+    for name, (kind, help_text) in METRICS_HELP.items():
+        full = METRICS_PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        if kind == "counter":
+            for (n, labels), v in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{full}{_prom_labels(labels)} {v:g}")
+            continue
+        for (n, labels), (counts, total, count) in sorted(hists.items()):
+            if n != name:
+                continue
+            acc = 0
+            for le, c in zip(buckets[name], counts):
+                acc += c
+                lines.append(f"{full}_bucket{_prom_labels(labels + (('le', f'{le:g}'),))} {acc}")
+            lines.append(f"{full}_bucket{_prom_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{full}_sum{_prom_labels(labels)} {total:.6f}")
+            lines.append(f"{full}_count{_prom_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+@app.before_request
+def _metrics_start():
+    g.t0 = time.perf_counter()
+
+@app.after_request
+def _metrics_record(resp):
+    t0 = g.pop("t0", None)
+    if t0 is not None:
+        labels = (("endpoint", request.endpoint or "404"), ("method", request.method),
+                  ("status", str(resp.status_code)))
+        metrics.observe("http_request_duration_seconds", labels, time.perf_counter() - t0, LATENCY_BUCKETS)
+        metrics.maybe_flush()
+    return resp
+
+_SQL_PARAMS_RE = re.compile(r"\?(\s*,\s*\?)*")
+_sql_labels: Dict[str, str] = {}
+
+def _sql_label(sql: str) -> str:
+    label = _sql_labels.get(sql)
+    if label is None:
+        label = " ".join(_SQL_PARAMS_RE.sub("?", sql).split())[:120]
+        if len(_sql_labels) < 1000:
+            _sql_labels[sql] = label
+    return label
+
+def _count_lock_error(label: str, e: sqlite3.OperationalError):
+    # SQLITE_BUSY (5) / SQLITE_LOCKED (6), inclusive os códigos estendidos.
+    if (getattr(e, "sqlite_errorcode", 0) or 0) & 0xFF in (5, 6):
+        metrics.inc("sql_lock_errors_total", (("statement", label),))
+
+class TimedConnection(sqlite3.Connection):
+    """Conexão que mede o tempo de cada comando (inclui espera por lock)."""
+
+    def execute(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        except sqlite3.OperationalError as e:
+            _count_lock_error(_sql_label(sql), e)
+            raise
+        finally:
+            metrics.observe("sql_statement_duration_seconds", (("statement", _sql_label(sql)),),
+                            time.perf_counter() - t0, SQL_BUCKETS)
+
+    def executemany(self, sql, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        except sqlite3.OperationalError as e:
+            _count_lock_error(_sql_label(sql), e)
+            raise
+        finally:
+            metrics.observe("sql_statement_duration_seconds", (("statement", _sql_label(sql)),),
+                            time.perf_counter() - t0, SQL_BUCKETS)
+
+    def __exit__(self, *exc):
+        t0 = time.perf_counter()
+        label = "COMMIT" if exc[0] is None else "ROLLBACK"
+        try:
+            return super().__exit__(*exc)
+        except sqlite3.OperationalError as e:
+            _count_lock_error(label, e)
+            raise
+        finally:
+            metrics.observe("sql_statement_duration_seconds", (("statement", label),),
+                            time.perf_counter() - t0, SQL_BUCKETS)
 
 # =====================================================
 # DB (SQLITE)
 # =====================================================
-def db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+# Uma conexão por thread (e por processo: o gunicorn faz fork dos workers),
+# reaproveitada entre requisições. WAL permite leituras concorrentes com uma
+# escrita; busy_timeout faz os workers esperarem o lock em vez de falhar.
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHED_STATEMENTS = 256
+# Leituras por mmap em vez de read(): páginas da base de conhecimento e do
+# histórico ficam no cache do SO, compartilhadas entre os workers.
+SQLITE_MMAP_BYTES = int(os.environ.get("SQLITE_MMAP_BYTES", str(64 * 1024 * 1024)))
+
+_local = threading.local()
+_db_ready = False
+_db_init_lock = threading.Lock()
+
+def ensure_db():
+    """Cria/migra o schema uma vez por processo. Com gunicorn.conf.py isso
+    acontece no master (on_starting) e os workers já nascem com _db_ready."""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_init_lock:
+        if not _db_ready:
+            init_db()
+            _db_ready = True
+
+def _connect() -> sqlite3.Connection:
+    ensure_db()
+    return _open_db()
+
+def _open_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+        factory=TimedConnection if METRICS_ENABLED else sqlite3.Connection,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_BYTES}")
+    return conn
+
+def db() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = _local.conn = _connect()
+        _local.pid = os.getpid()
     return conn
 
+@app.teardown_appcontext
+def _release_db(exc):
+    # A conexão fica aberta para a próxima requisição; só não pode
+    # carregar uma transação pendente adiante.
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
+
 def init_db():
-    conn = db()
-    cur = conn.cursor()
-    cur.execute("""
+    # Conexão própria, fechada ao final: init_db roda no master do gunicorn,
+    # antes do fork (ver ensure_db).
+    conn = _open_db()
+    # Só vale para bancos novos; nos antigos, `flask history-compact --vacuum`.
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS qa_history (
             id INTEGER PRIMARY KEY,
             question TEXT,
@@ -307,129 +492,1249 @@ def init_db():
             created_at TEXT
         )
     """)
+    # Respostas guardadas uma vez só, endereçadas pelo hash do conteúdo.
+    # qa_history.answer fica NULL nas linhas novas; as antigas são migradas
+    # aos poucos pela compactação.
+    if "answer_hash" not in {r["name"] for r in conn.execute("PRAGMA table_info(qa_history)")}:
+        conn.execute("ALTER TABLE qa_history ADD COLUMN answer_hash TEXT")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS qa_answers (
+            hash TEXT PRIMARY KEY,
+            answer TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS qa_history_answer_hash ON qa_history(answer_hash);
+        CREATE INDEX IF NOT EXISTS qa_history_legacy ON qa_history(id) WHERE answer IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS qa_history_created_at ON qa_history(created_at);
+        CREATE INDEX IF NOT EXISTS qa_history_legacy_ts ON qa_history(id) WHERE created_at GLOB '[0-3][0-9]/*';
+    """)
+    fts_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'qa_history_fts'"
+    ).fetchone() is not None
+    conn.executescript(HISTORY_FTS_SCHEMA)
+    if not fts_exists:
+        # Banco anterior ao índice: indexa o que já existe (uma vez só).
+        conn.execute("INSERT INTO qa_history_fts(qa_history_fts) VALUES ('rebuild')")
+    conn.executescript(KB_SCHEMA)
+    if "answer_html" not in {r["name"] for r in conn.execute("PRAGMA table_info(kb_entries)")}:
+        conn.execute("ALTER TABLE kb_entries ADD COLUMN answer_html TEXT")
+    conn.executescript(COUNTERS_SCHEMA)
     conn.commit()
+    if conn.execute("SELECT 1 FROM kb_entries LIMIT 1").fetchone() is None:
+        with open(KB_SEED_PATH, encoding="utf-8") as f:
+            kb_import(conn, json.load(f))
+    built = conn.execute("SELECT value FROM kb_meta WHERE key = 'answers_build'").fetchone()
+    if built is None or built[0] != BUILD_FINGERPRINT:
+        with conn:
+            _kb_compile_answers(conn)
     conn.close()
 
+# Busca no histórico: FTS5 sobre qa_history.question, sem acento, mantido
+# pelos triggers (inclusive nas exclusões da retenção).
+HISTORY_FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS qa_history_fts USING fts5(
+        question,
+        content='qa_history', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS qa_history_fts_ai AFTER INSERT ON qa_history BEGIN
+        INSERT INTO qa_history_fts(rowid, question) VALUES (new.id, new.question);
+    END;
+    CREATE TRIGGER IF NOT EXISTS qa_history_fts_ad AFTER DELETE ON qa_history BEGIN
+        INSERT INTO qa_history_fts(qa_history_fts, rowid, question) VALUES ('delete', old.id, old.question);
+    END;
+    CREATE TRIGGER IF NOT EXISTS qa_history_fts_au AFTER UPDATE OF question ON qa_history BEGIN
+        INSERT INTO qa_history_fts(qa_history_fts, rowid, question) VALUES ('delete', old.id, old.question);
+        INSERT INTO qa_history_fts(rowid, question) VALUES (new.id, new.question);
+    END;
+"""
+
+def _answer_hash(answer: str) -> str:
+    return hashlib.sha256(answer.encode("utf-8")).hexdigest()[:32]
+
+def _insert_history(conn: sqlite3.Connection, rows: List[tuple]) -> List[int]:
+    hashes = [_answer_hash(a or "") for _, a, _ in rows]
+    conn.executemany(
+        "INSERT OR IGNORE INTO qa_answers (hash, answer) VALUES (?,?)",
+        {h: a or "" for h, (_, a, _) in zip(hashes, rows)}.items()
+    )
+    ids = []
+    for (question, _, created_at), h in zip(rows, hashes):
+        ids.append(conn.execute(
+            "INSERT INTO qa_history (question, answer_hash, created_at) VALUES (?,?,?)",
+            (question, h, created_at)
+        ).lastrowid)
+    bump_counters(conn, [(q, created_at, 1) for q, _, created_at in rows])
+    return ids
+
+# =====================================================
+# HISTÓRICO EM WRITE-BEHIND (opcional)
+# =====================================================
+# Com HISTORY_WRITE_BEHIND=1 a requisição só enfileira a pergunta; uma thread
+# por worker grava em lote (uma transação a cada N linhas ou T ms). Fila cheia
+# = backpressure: espera um pouco e, se não couber, grava na própria requisição.
+HISTORY_WRITE_BEHIND = os.environ.get("HISTORY_WRITE_BEHIND", "0") == "1"
+HISTORY_FLUSH_ROWS = int(os.environ.get("HISTORY_FLUSH_ROWS", "100"))
+HISTORY_FLUSH_MS = int(os.environ.get("HISTORY_FLUSH_MS", "200"))
+HISTORY_QUEUE_MAX = int(os.environ.get("HISTORY_QUEUE_MAX", "10000"))
+HISTORY_ENQUEUE_TIMEOUT_S = 0.5
+HISTORY_RETRY_MAX_S = 5.0
+
+_STOP = object()
+_start_lock = threading.Lock()
+
+class HistoryWriter:
+    def __init__(self, flush_rows: int, flush_ms: int, maxsize: int):
+        self.flush_rows = flush_rows
+        self.flush_s = flush_ms / 1000
+        self.maxsize = maxsize
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with _start_lock:
+            if self._pid == os.getpid():
+                return
+            # Estado novo a cada processo: fila e thread não sobrevivem ao fork.
+            self._queue = queue.Queue(self.maxsize)
+            self._pending = deque()
+            self._lock = threading.Lock()
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def submit(self, row: tuple):
+        global _history_gen
+        self._ensure_started()
+        item = {"id": None, "question": row[0], "answer": row[1], "created_at": row[2]}
+        with self._lock:
+            self._pending.append(item)
+        try:
+            self._queue.put(item, timeout=HISTORY_ENQUEUE_TIMEOUT_S)
+        except queue.Full:
+            # Fila cheia: grava aqui mesmo. O item nunca entrou na fila, então
+            # só esta thread o tira de _pending.
+            try:
+                with db() as conn:
+                    item["id"] = _insert_history(conn, [row])[0]
+                _history_gen += 1
+            finally:
+                self._discard([item])
+
+    def pending(self) -> List[dict]:
+        """Linhas enfileiradas e ainda não gravadas, da mais nova para a mais antiga."""
+        if self._pid != os.getpid():
+            return []
+        with self._lock:
+            return list(reversed(self._pending))
+
+    def close(self, timeout: float = 10.0):
+        """Esvazia a fila antes de o worker sair; o que a thread não gravar a
+        tempo (ou se ela já morreu) é gravado aqui mesmo."""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+                self._thread.join(max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                pass
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            conn = _connect()
+            try:
+                self._flush(conn, batch, deadline)
+            finally:
+                conn.close()
+
+    def _run(self):
+        conn = _connect()
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_s
+            while len(batch) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._flush(conn, batch)
+            except Exception:
+                # A thread só sai com _STOP: se ela morresse, a fila pararia
+                # e as linhas ficariam "pendentes" para sempre.
+                app.logger.exception("history-writer: lote de %d linhas perdido", len(batch))
+                self._discard(batch)
+        conn.close()
+
+    def _discard(self, items: List[dict]):
+        # Por identidade: a ordem de _pending (append em submit) e a da fila
+        # podem divergir entre threads, e dicts iguais não são o mesmo item.
+        done = {id(it) for it in items}
+        with self._lock:
+            self._pending = deque(it for it in self._pending if id(it) not in done)
+
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple], deadline: float = None) -> List[int]:
+        # Banco travado ou disco cheio passam: tenta de novo em vez de
+        # descartar (até `deadline`, se houver). Enquanto isso a fila enche e
+        # submit grava direto. Outros erros sobem na hora.
+        attempt = 0
+        while True:
+            try:
+                with conn:
+                    return _insert_history(conn, rows)
+            except sqlite3.OperationalError:
+                app.logger.exception("history-writer: falha ao gravar %d linhas", len(rows))
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+                time.sleep(min(0.1 * 2 ** attempt, HISTORY_RETRY_MAX_S))
+                attempt += 1
+
+    def _flush(self, conn: sqlite3.Connection, batch: List[dict], deadline: float = None):
+        rows = [(it["question"], it["answer"], it["created_at"]) for it in batch]
+        try:
+            ids = self._write(conn, rows, deadline)
+        except Exception:
+            # Lote recusado (ex.: IntegrityError): grava linha a linha, para
+            # perder só a que não entra.
+            app.logger.exception("history-writer: lote de %d linhas recusado; gravando uma a uma", len(rows))
+            ids = []
+            for row in rows:
+                try:
+                    ids += self._write(conn, [row], deadline)
+                except Exception:
+                    app.logger.exception("history-writer: linha de %s descartada", row[2])
+                    ids.append(None)
+        # ids só depois do commit: get_history usa o id para não duplicar.
+        for it, row_id in zip(batch, ids):
+            it["id"] = row_id
+        self._discard(batch)
+
+history_writer = HistoryWriter(HISTORY_FLUSH_ROWS, HISTORY_FLUSH_MS, HISTORY_QUEUE_MAX)
+
+# Página mais recente do histórico, por thread (cada uma tem sua conexão).
+# Vale enquanto PRAGMA data_version (muda quando outra conexão grava) e
+# _history_gen (gravações deste processo) não mudarem.
+HISTORY_RECENT_CACHE = 50
+HISTORY_PAGE_MAX = 200
+_history_gen = 0
+
 def save_history(question: str, answer: str):
+    save_history_many([(question, answer)])
+
+def save_history_many(pairs: List[tuple]):
+    """Grava várias (pergunta, resposta) numa única transação."""
+    global _history_gen
+    now = datetime.now().isoformat(timespec="seconds")
+    rows = [(q, a, now) for q, a in pairs]
+    if HISTORY_WRITE_BEHIND:
+        for row in rows:
+            history_writer.submit(row)
+        history_compactor.ensure_started()
+        return
+    with db() as conn:
+        _insert_history(conn, rows)
+    _history_gen += 1
+    history_compactor.ensure_started()
+
+def _history_page(limit: int, before: int = None) -> List[dict]:
+    rows = db().execute(
+        """SELECT h.id, h.question, COALESCE(h.answer, a.answer) AS answer, h.created_at
+           FROM qa_history h LEFT JOIN qa_answers a ON a.hash = h.answer_hash
+           WHERE h.id < ? ORDER BY h.id DESC LIMIT ?""",
+        (2**63 - 1 if before is None else before, limit)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+def _recent_history() -> List[dict]:
     conn = db()
+    key = (id(conn), conn.execute("PRAGMA data_version").fetchone()[0], _history_gen)
+    cached = getattr(_local, "recent_history", None)
+    if cached is None or cached[0] != key:
+        cached = _local.recent_history = (key, _history_page(HISTORY_RECENT_CACHE))
+    return cached[1]
+
+def get_history(limit: int = 50, before: int = None, include_pending: bool = True) -> List[dict]:
+    """Histórico do mais novo para o mais antigo; `before` = id do último item
+    da página anterior (paginação por cursor, sem OFFSET). Com include_pending, a
+    primeira página traz no topo as linhas ainda na fila do write-behind
+    (sem id: não servem de cursor)."""
+    if before is not None:
+        return _history_page(limit, before)
+    pending = history_writer.pending() if HISTORY_WRITE_BEHIND and include_pending else []
+    if limit <= HISTORY_RECENT_CACHE:
+        history = list(_recent_history()[:limit])
+    else:
+        history = _history_page(limit)
+    if pending:
+        # Read-your-own-write: o que ainda está na fila deste worker aparece
+        # no topo; o que foi gravado durante a leitura já veio do banco.
+        seen = {h["id"] for h in history}
+        history = [dict(p) for p in pending if p["id"] not in seen] + history
+    return history[:limit]
+
+# Relevância é calculada sobre os HISTORY_SEARCH_SCAN resultados mais recentes
+# que casam: perguntas muito comuns casam com milhões de linhas, e ordenar
+# todas por bm25 custaria segundos.
+HISTORY_SEARCH_SCAN = 1000
+
+def _history_search_expr(q: str) -> str:
+    # Palavras inteiras (singular ou plural), não prefixos: num histórico de
+    # milhões de linhas, "termo"* junta a lista de documentos inteira antes de
+    # devolver a primeira linha; termos exatos são lidos sob demanda.
+    words = _TOKEN_RE.findall(_fold(q))
+    words = [w for w in words if w not in _STOPWORDS] or words
+    groups = []
+    for w in dict.fromkeys(words):
+        variants = {w, w[:-1] if w.endswith("s") and len(w) > 3 else w + "s"}
+        groups.append("(" + " OR ".join(f'"{v}"' for v in sorted(variants)) + ")")
+    return " AND ".join(groups)
+
+# created_at é carimbado antes do lock de escrita (e, no write-behind, na
+# fila), então ids e horários podem sair fora de ordem por alguns segundos.
+# HISTORY_CLOCK_SLACK_S é o máximo que se admite: a faixa de ids é alargada
+# por essa folga e o filtro exato continua sendo o de created_at.
+HISTORY_CLOCK_SLACK_S = int(os.environ.get("HISTORY_CLOCK_SLACK_S", "60"))
+
+# Datas legadas ("dd/mm HH:MM", ainda não migradas pela compactação) não têm
+# ano e se intercalam com as ISO na ordem de texto: ficam fora de qualquer
+# filtro por período.
+_ISO_TS = "created_at GLOB '[0-9][0-9][0-9][0-9]-*'"
+
+def _shift_ts(ts: str, seconds: int):
+    try:
+        return (datetime.fromisoformat(ts) + timedelta(seconds=seconds)).isoformat(timespec="seconds")
+    except ValueError:
+        return None  # data legada: sem limite por id
+
+def _history_id_bounds(since: str = None, until: str = None, conn: sqlite3.Connection = None) -> tuple:
+    """Faixa de ids que contém todas as linhas de [since, until), pelo índice
+    de created_at. Uma linha com id menor que a de menor created_at >= since
+    só pode ter created_at até essa data + a folga (e o simétrico no fim):
+    basta o MIN/MAX de id nessa janela."""
+    conn = conn or db()
+    lo, hi = 0, 2**63 - 1
+    if since:
+        row = conn.execute(
+            f"SELECT created_at FROM qa_history WHERE created_at >= ? AND {_ISO_TS} ORDER BY created_at LIMIT 1",
+            (since,)
+        ).fetchone()
+        edge = row and _shift_ts(row[0], HISTORY_CLOCK_SLACK_S)
+        if row is None:
+            lo = hi
+        elif edge:
+            lo = conn.execute(
+                f"SELECT MIN(id) FROM qa_history WHERE created_at >= ? AND created_at <= ? AND {_ISO_TS}",
+                (since, edge)
+            ).fetchone()[0]
+    if until:
+        row = conn.execute(
+            f"SELECT created_at FROM qa_history WHERE created_at < ? AND {_ISO_TS} ORDER BY created_at DESC LIMIT 1",
+            (until,)
+        ).fetchone()
+        edge = row and _shift_ts(row[0], -HISTORY_CLOCK_SLACK_S)
+        if row is None:
+            hi = -1
+        elif edge:
+            hi = conn.execute(
+                f"SELECT MAX(id) FROM qa_history WHERE created_at >= ? AND created_at < ? AND {_ISO_TS}",
+                (edge, until)
+            ).fetchone()[0]
+    return lo, hi
+
+def search_history(q: str, since: str = None, until: str = None, order: str = "recentes",
+                   limit: int = 50, before: int = None) -> List[dict]:
+    """Busca (sem acento, singular/plural) nas perguntas do histórico, em [since, until)."""
+    expr = _history_search_expr(q)
+    if not expr:
+        return []
+    lo, hi = _history_id_bounds(since, until)
+    if before is not None:
+        hi = min(hi, before - 1)
+    if lo > hi:
+        return []
+    relevance = order == "relevancia"
+    # bm25 só quando pedido: ele lê a lista inteira do termo para saber em
+    # quantos documentos ele aparece.
+    # O filtro de created_at fica dentro do LIMIT: linhas da folga de ids
+    # que estão fora do período não ocupam vaga.
+    period = f"AND h.created_at >= ? AND h.created_at < ? AND h.{_ISO_TS}" if since or until else ""
+    rows = db().execute(
+        f"""SELECT m.id, m.question, m.created_at FROM (
+                SELECT h.id, h.question, h.created_at,
+                       {"bm25(qa_history_fts)" if relevance else "0"} AS score
+                FROM qa_history_fts f JOIN qa_history h ON h.id = f.rowid
+                WHERE qa_history_fts MATCH ? AND f.rowid BETWEEN ? AND ? {period}
+                ORDER BY f.rowid DESC LIMIT ?
+            ) m
+            ORDER BY {"m.score, m.id DESC" if relevance else "m.id DESC"} LIMIT ?""",
+        (expr, lo, hi, *((since or "", until or "\uffff") if period else ()),
+         HISTORY_SEARCH_SCAN if relevance else limit, limit)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+# =====================================================
+# EXPORTAÇÃO DO HISTÓRICO (CSV / NDJSON)
+# =====================================================
+# Lê em blocos por cursor de id numa conexão própria (nada de fetchall da
+# tabela inteira) e devolve bytes à medida que cada bloco fica pronto, com
+# gzip opcional feito na hora. Memória constante: um bloco por vez.
+# O teto de id é fixado no início; linhas gravadas durante a exportação
+# ficam para a próxima (retomável com desde_id = último id exportado).
+HISTORY_EXPORT_CHUNK = int(os.environ.get("HISTORY_EXPORT_CHUNK", "2000"))
+HISTORY_EXPORT_FIELDS = ["id", "created_at", "question", "answer"]
+
+def _parse_date(value: str, end: bool = False):
+    """Data/hora ISO -> texto comparável com created_at; `end` com só a data
+    avança para o dia seguinte (limite exclusivo que inclui o dia todo)."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        dt += timedelta(days=1)
+    return dt.isoformat(timespec="seconds")
+
+def export_history(fmt: str = "csv", since: str = None, until: str = None, after_id: int = 0,
+                   answers: bool = True, compress: bool = False, chunk: int = HISTORY_EXPORT_CHUNK):
+    """Gera o histórico em [since, until) com id > after_id, em blocos de bytes."""
+    fields = HISTORY_EXPORT_FIELDS if answers else HISTORY_EXPORT_FIELDS[:-1]
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="")
+    # Respostas se repetem muito: escapa cada uma (pelo hash) uma vez só.
+    cells = {}
+
+    def answer_cell(answer_hash, answer):
+        cell = cells.get(answer_hash) if answer_hash else None
+        if cell is None:
+            if fmt == "csv":
+                buf.seek(0)
+                buf.truncate()
+                writer.writerow([answer])
+                cell = buf.getvalue()
+            else:
+                cell = json.dumps(answer, ensure_ascii=False)
+            if answer_hash and len(cells) < 4096:
+                cells[answer_hash] = cell
+        return cell
+
+    def out(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return gz.compress(data) if gz else data
+
+    conn = _connect()
+    try:
+        lo, hi = _history_id_bounds(since, until, conn)
+        last = max(after_id or 0, lo - 1)
+        top = conn.execute("SELECT MAX(id) FROM qa_history").fetchone()[0] or 0
+        hi = min(hi, top)
+        answer_sql = "COALESCE(h.answer, a.answer)" if answers else "NULL"
+        # Com período, datas legadas ("dd/mm") ficam de fora: não se comparam com ISO.
+        period = f"AND h.{_ISO_TS}" if since or until else ""
+        if fmt == "csv":
+            yield out(",".join(fields) + "\r\n")
+        while last < hi:
+            rows = conn.execute(
+                f"""SELECT h.id, h.created_at, h.question, h.answer_hash, {answer_sql} AS answer
+                    FROM qa_history h LEFT JOIN qa_answers a ON a.hash = h.answer_hash
+                    WHERE h.id > ? AND h.id <= ? {period} ORDER BY h.id LIMIT ?""",
+                (last, hi, chunk)
+            ).fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            lines = []
+            for row_id, created_at, question, answer_hash, answer in rows:
+                if (since and created_at < since) or (until and created_at >= until):
+                    continue
+                if fmt == "csv":
+                    buf.seek(0)
+                    buf.truncate()
+                    writer.writerow((row_id, created_at, question))
+                    line = buf.getvalue()
+                    if answers:
+                        line += "," + answer_cell(answer_hash, answer)
+                    lines.append(line + "\r\n")
+                else:
+                    line = (f'{{"id": {row_id}, "created_at": {json.dumps(created_at)}, '
+                            f'"question": {json.dumps(question, ensure_ascii=False)}')
+                    if answers:
+                        line += ', "answer": ' + answer_cell(answer_hash, answer)
+                    lines.append(line + "}\n")
+            if lines:
+                yield out("".join(lines))
+        if gz:
+            yield gz.flush()
+    finally:
+        conn.close()
+
+@app.cli.command("history-export")
+@click.argument("path", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--formato", type=click.Choice(["csv", "ndjson"]), default="csv")
+@click.option("--de", "since", help="Data inicial (AAAA-MM-DD ou data/hora ISO).")
+@click.option("--ate", "until", help="Data final, inclusive quando só a data.")
+@click.option("--desde-id", "after_id", type=int, default=0, help="Exporta só ids maiores que este.")
+@click.option("--sem-respostas", is_flag=True, help="Omite a coluna answer.")
+@click.option("--gzip", "compress", is_flag=True, help="Comprime a saída (gzip).")
+def history_export_command(path, formato, since, until, after_id, sem_respostas, compress):
+    """Exporta o histórico em CSV ou NDJSON, em blocos ("-" = saída padrão)."""
+    chunks = export_history(formato, _parse_date(since), _parse_date(until, end=True),
+                            after_id, not sem_respostas, compress)
+    with click.open_file(path, "wb") as f:
+        for data in chunks:
+            f.write(data)
+
+# =====================================================
+# RETENÇÃO E COMPACTAÇÃO DO HISTÓRICO
+# =====================================================
+# Uma thread por worker faz, a cada intervalo, passos curtos (uma transação de
+# até HISTORY_COMPACT_BATCH linhas cada): migra linhas antigas com a resposta
+# inline para qa_answers e a data "dd/mm HH:MM" para ISO, apaga o que passou
+# de HISTORY_MAX_ROWS ou HISTORY_MAX_AGE_DAYS, remove
+# respostas órfãs e devolve páginas livres ao disco. Os passos são idempotentes,
+# então vários workers podem rodar ao mesmo tempo sem combinar nada.
+HISTORY_MAX_ROWS = int(os.environ.get("HISTORY_MAX_ROWS", "0"))  # 0 = sem limite
+HISTORY_MAX_AGE_DAYS = int(os.environ.get("HISTORY_MAX_AGE_DAYS", "0"))  # 0 = sem limite
+HISTORY_COMPACT_INTERVAL_S = float(os.environ.get("HISTORY_COMPACT_INTERVAL_S", "300"))  # 0 = desliga
+HISTORY_COMPACT_BATCH = int(os.environ.get("HISTORY_COMPACT_BATCH", "5000"))
+
+def _legacy_created_at(text: str, ref: datetime) -> datetime:
+    """"dd/mm HH:MM" -> o datetime mais recente que não passa de `ref`."""
+    try:
+        parsed = datetime.strptime("2000/" + text, "%Y/%d/%m %H:%M")  # ano bissexto: aceita 29/02
+    except ValueError:
+        return ref
+    for year in range(ref.year, ref.year - 8, -1):
+        try:
+            dt = parsed.replace(year=year)
+        except ValueError:  # 29/02 fora de ano bissexto
+            continue
+        if dt <= ref:
+            return dt
+    return ref
+
+def compact_history_step(conn: sqlite3.Connection, batch: int = HISTORY_COMPACT_BATCH) -> Dict[str, int]:
+    """Um passo limitado de compactação; tudo zero = nada mais a fazer."""
+    done = {"migrated": 0, "dated": 0, "expired": 0, "orphans": 0, "counters": 0}
+    with conn:
+        legacy = conn.execute(
+            "SELECT id, answer FROM qa_history WHERE answer IS NOT NULL LIMIT ?", (batch,)
+        ).fetchall()
+        if legacy:
+            hashes = [(_answer_hash(r["answer"]), r["id"]) for r in legacy]
+            conn.executemany(
+                "INSERT OR IGNORE INTO qa_answers (hash, answer) VALUES (?,?)",
+                {h: r["answer"] for (h, _), r in zip(hashes, legacy)}.items()
+            )
+            conn.executemany(
+                "UPDATE qa_history SET answer_hash = ?, answer = NULL WHERE id = ?", hashes
+            )
+            done["migrated"] = len(legacy)
+
+    with conn:
+        # Datas sem ano: do mais novo para o mais antigo, partindo da linha
+        # ISO seguinte (ou de agora), voltando um ano a cada virada.
+        legacy = conn.execute(
+            """SELECT id, created_at FROM qa_history WHERE created_at GLOB '[0-3][0-9]/*'
+               ORDER BY id DESC LIMIT ?""", (batch,)
+        ).fetchall()
+        if legacy:
+            ref = conn.execute(
+                """SELECT created_at FROM qa_history WHERE id > ?
+                   AND created_at GLOB '[0-9][0-9][0-9][0-9]-*' ORDER BY id LIMIT 1""",
+                (legacy[0]["id"],)
+            ).fetchone()
+            ref = datetime.fromisoformat(ref[0]) if ref else datetime.now()
+            dated = []
+            for r in legacy:
+                ref = _legacy_created_at(r["created_at"], ref)
+                dated.append((ref.isoformat(timespec="seconds"), r["id"]))
+            conn.executemany("UPDATE qa_history SET created_at = ? WHERE id = ?", dated)
+            done["dated"] = len(dated)
+
+    if HISTORY_MAX_ROWS > 0:
+        with conn:
+            cutoff = conn.execute(
+                "SELECT id FROM qa_history ORDER BY id DESC LIMIT 1 OFFSET ?", (HISTORY_MAX_ROWS,)
+            ).fetchone()
+            if cutoff is not None:
+                done["expired"] = conn.execute(
+                    """DELETE FROM qa_history WHERE id IN (
+                           SELECT id FROM qa_history WHERE id <= ? ORDER BY id LIMIT ?)""",
+                    (cutoff[0], batch)
+                ).rowcount
+
+    if HISTORY_MAX_AGE_DAYS > 0:
+        cutoff = (datetime.now() - timedelta(days=HISTORY_MAX_AGE_DAYS)).isoformat(timespec="seconds")
+        with conn:
+            done["expired"] += conn.execute(
+                """DELETE FROM qa_history WHERE id IN (
+                       SELECT id FROM qa_history WHERE created_at < ?
+                       AND created_at GLOB '[0-9][0-9][0-9][0-9]-*' LIMIT ?)""",
+                (cutoff, batch)
+            ).rowcount
+
+    with conn:
+        done["orphans"] = conn.execute(
+            """DELETE FROM qa_answers WHERE hash IN (
+                   SELECT hash FROM qa_answers a
+                   WHERE NOT EXISTS (SELECT 1 FROM qa_history h WHERE h.answer_hash = a.hash)
+                   LIMIT ?)""",
+            (batch,)
+        ).rowcount
+    oldest = datetime.now() - timedelta(days=COUNTERS_KEEP_DAYS)
+    with conn:
+        # Baldes diários antigos e os "total"/semanais de versões anteriores.
+        done["counters"] = conn.execute(
+            """DELETE FROM qa_counters WHERE (kind, key, period) IN (SELECT kind, key, period FROM qa_counters
+               WHERE period NOT GLOB 'd:*' OR period < ? LIMIT ?)""",
+            (f"d:{oldest.date().isoformat()}", batch)
+        ).rowcount
+    conn.execute("PRAGMA incremental_vacuum(1000)").fetchall()  # libera uma página por linha lida
+    return done
+
+def compact_history(conn: sqlite3.Connection, batch: int = HISTORY_COMPACT_BATCH) -> Dict[str, int]:
+    """Repete os passos até não sobrar trabalho."""
+    total = {"migrated": 0, "dated": 0, "expired": 0, "orphans": 0, "counters": 0}
+    while True:
+        done = compact_history_step(conn, batch)
+        for k, v in done.items():
+            total[k] += v
+        if not any(done.values()):
+            return total
+
+class HistoryCompactor:
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self._pid = None
+
+    def ensure_started(self):
+        if self.interval_s <= 0 or self._pid == os.getpid():
+            return
+        with _start_lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name="history-compactor", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        conn = _connect()
+        while True:
+            time.sleep(self.interval_s)
+            try:
+                # Passo a passo, com folga entre eles, para não monopolizar o lock de escrita.
+                while any(compact_history_step(conn).values()):
+                    time.sleep(0.05)
+            except sqlite3.Error:
+                app.logger.exception("history-compactor: falha na compactação")
+
+history_compactor = HistoryCompactor(HISTORY_COMPACT_INTERVAL_S)
+
+@app.cli.command("history-compact")
+@click.option("--vacuum", is_flag=True, help="Reescreve o arquivo (libera espaço em bancos antigos).")
+def history_compact_command(vacuum):
+    """Migra respostas para qa_answers e aplica a retenção do histórico."""
+    conn = _connect()
+    total = compact_history(conn)
+    click.echo(f"{total['migrated']} linhas migradas, {total['dated']} datas convertidas, "
+               f"{total['expired']} expiradas, "
+               f"{total['orphans']} respostas órfãs removidas.")
+    if vacuum:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        click.echo("VACUUM concluído.")
+    conn.close()
+
+# =====================================================
+# BASE DE CONHECIMENTO (SQLITE + FTS5)
+# =====================================================
+# Perguntas e respostas ficam em kb_entries; kb_fts indexa pergunta, resposta
+# e os termos normalizados (_terms) usados na busca aproximada. A versão é o
+# hash do conteúdo importado: cada worker confere a versão a cada
+# KB_RELOAD_INTERVAL_S e descarta seus caches quando ela muda, sem restart.
+KB_SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base.json")
+KB_RELOAD_INTERVAL_S = float(os.environ.get("KB_RELOAD_INTERVAL_S", "2"))
+ANSWER_MIN_CONFIDENCE = float(os.environ.get("ANSWER_MIN_CONFIDENCE", "0.5"))
+
+KB_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS kb_entries (
+        id INTEGER PRIMARY KEY,
+        question TEXT NOT NULL UNIQUE,
+        tag TEXT,
+        quick INTEGER NOT NULL DEFAULT 0,
+        position INTEGER NOT NULL DEFAULT 0,
+        title TEXT,
+        bullets TEXT NOT NULL DEFAULT '[]',
+        delicate INTEGER NOT NULL DEFAULT 1,
+        body TEXT NOT NULL DEFAULT '',
+        terms TEXT NOT NULL DEFAULT '',
+        answer_html TEXT
+    );
+    CREATE INDEX IF NOT EXISTS kb_entries_quick ON kb_entries (quick, position);
+    CREATE VIRTUAL TABLE IF NOT EXISTS kb_fts USING fts5(
+        question, body, terms,
+        content='kb_entries', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS kb_vocab USING fts5vocab(kb_fts, 'col');
+    CREATE TABLE IF NOT EXISTS kb_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+"""
+
+def kb_import(conn: sqlite3.Connection, data: dict) -> str:
+    """Substitui a base inteira pelo conteúdo de `data` e devolve a nova versão."""
+    entries = data.get("entries") or []
+    canonical = json.dumps(entries, ensure_ascii=False, sort_keys=True)
+    version = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+    rows = []
+    for pos, e in enumerate(entries):
+        question = (e.get("question") or "").strip()
+        if not question:
+            raise ValueError(f"entrada {pos}: pergunta vazia")
+        bullets = [b for b in (e.get("bullets") or []) if (b or "").strip()]
+        rows.append((
+            question, e.get("tag"), 1 if e.get("quick") else 0, pos,
+            e.get("title"), json.dumps(bullets, ensure_ascii=False),
+            0 if e.get("delicate") is False else 1,
+            " ".join([e.get("title") or ""] + bullets),
+            " ".join(_terms(question)),
+        ))
+    with conn:
+        conn.execute("DELETE FROM kb_entries")
+        conn.executemany(
+            "INSERT INTO kb_entries (question, tag, quick, position, title, bullets, delicate, body, terms) "
+            "VALUES (?,?,?,?,?,?,?,?,?)",
+            rows
+        )
+        conn.execute("INSERT INTO kb_fts (kb_fts) VALUES ('rebuild')")
+        _kb_compile_answers(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO kb_meta (key, value) VALUES (?, ?)",
+            [("version", version), ("entries", str(len(rows)))]
+        )
+    return version
+
+def _kb_compile_answers(conn: sqlite3.Connection):
+    """Grava o HTML pronto de cada resposta (answer_html), marcado com a build
+    que o gerou; os workers leem a coluna em vez de renderizar de novo.
+    Roda dentro da transação de quem chama."""
+    rows = conn.execute(
+        "SELECT id, title, bullets, delicate FROM kb_entries WHERE title IS NOT NULL AND title != ''"
+    ).fetchall()
+    conn.executemany(
+        "UPDATE kb_entries SET answer_html = ? WHERE id = ?",
+        [(_make_answer(r["title"], json.loads(r["bullets"]), bool(r["delicate"])), r["id"]) for r in rows]
+    )
     conn.execute(
-        "INSERT INTO qa_history (question, answer, created_at) VALUES (?,?,?)",
-        (question, answer, datetime.now().strftime("%d/%m %H:%M"))
+        "INSERT OR REPLACE INTO kb_meta (key, value) VALUES ('answers_build', ?)", (BUILD_FINGERPRINT,)
     )
-    conn.commit()
-    conn.close()
 
-def get_history(limit: int = 50):
+def kb_export(conn: sqlite3.Connection) -> dict:
+    entries = []
+    for r in conn.execute("SELECT * FROM kb_entries ORDER BY position, id"):
+        e = {"question": r["question"], "tag": r["tag"], "quick": bool(r["quick"])}
+        if r["title"]:
+            e["title"] = r["title"]
+            e["bullets"] = json.loads(r["bullets"])
+            e["delicate"] = bool(r["delicate"])
+        entries.append(e)
+    return {"entries": entries}
+
+_kb_state = {"version": None, "entries": 0, "checked": 0.0, "pid": None}
+
+def kb_version() -> str:
+    now = time.monotonic()
+    if _kb_state["pid"] != os.getpid() or now - _kb_state["checked"] >= KB_RELOAD_INTERVAL_S:
+        meta = dict(db().execute("SELECT key, value FROM kb_meta").fetchall())
+        _kb_state.update(
+            version=meta.get("version"), entries=int(meta.get("entries") or 0),
+            checked=now, pid=os.getpid(),
+        )
+    return _kb_state["version"]
+
+def kb_version_cached():
+    """Versão já conferida por este processo, sem ir ao banco; None quando
+    passou KB_RELOAD_INTERVAL_S e é preciso chamar kb_version()."""
+    if _kb_state["pid"] != os.getpid() or time.monotonic() - _kb_state["checked"] >= KB_RELOAD_INTERVAL_S:
+        return None
+    return _kb_state["version"]
+
+def _match_confidence(q_terms: set, d_terms: set, idf) -> float:
+    """Peso (idf) dos termos em comum sobre o peso dos termos da pergunta (75%)
+    e da entrada (25%): termos que a base não conhece puxam para baixo."""
+    common = sum(idf(t) for t in q_terms & d_terms)
+    q_weight = sum(idf(t) for t in q_terms)
+    d_weight = sum(idf(t) for t in d_terms) or 1.0
+    return 0.75 * common / q_weight + 0.25 * common / d_weight
+
+def kb_best_match(q: str, min_confidence: float = ANSWER_MIN_CONFIDENCE):
+    """(entrada, confiança) mais parecida com `q`, ou None abaixo do limiar."""
+    q_terms = set(_terms(q))
+    if not q_terms:
+        return None
     conn = db()
-    rows = conn.execute(
-        "SELECT * FROM qa_history ORDER BY id DESC LIMIT ?",
-        (limit,)
+    # Termos só têm [a-z0-9]: podem ir entre aspas direto na expressão FTS.
+    expr = "terms : (" + " OR ".join(f'"{t}"' for t in sorted(q_terms)) + ")"
+    cands = conn.execute(
+        "SELECT e.* FROM kb_entries e JOIN ("
+        "  SELECT rowid FROM kb_fts WHERE kb_fts MATCH ?"
+        "  ORDER BY bm25(kb_fts, 0.0, 0.0, 1.0) LIMIT 3"
+        ") f ON e.id = f.rowid",
+        (expr,)
+    ).fetchall()
+    if not cands:
+        return None
+    all_terms = set(q_terms)
+    for c in cands:
+        all_terms.update(c["terms"].split())
+    marks = ",".join("?" * len(all_terms))
+    df = dict(conn.execute(
+        f"SELECT term, doc FROM kb_vocab WHERE col = 'terms' AND term IN ({marks})",
+        list(all_terms)
+    ).fetchall())
+    kb_version()
+    n = _kb_state["entries"]
+
+    def idf(t):
+        d = df.get(t, 0)
+        return math.log(1 + (n - d + 0.5) / (d + 0.5))
+
+    best = max(
+        ((c, _match_confidence(q_terms, set(c["terms"].split()), idf)) for c in cands),
+        key=lambda hit: hit[1],
+    )
+    return best if best[1] >= min_confidence else None
+
+def kb_lookup(q: str):
+    """(entrada, "exact" | "fuzzy") pela pergunta exata ou pela busca aproximada."""
+    row = db().execute("SELECT * FROM kb_entries WHERE question = ?", (q,)).fetchone()
+    if row is not None:
+        return row, "exact"
+    hit = kb_best_match(q)
+    return (hit[0], "fuzzy") if hit else (None, "miss")
+
+def kb_search(q: str, limit: int = 20) -> List[dict]:
+    """Busca textual (prefixos, sem acento) em perguntas e respostas."""
+    words = _TOKEN_RE.findall(_fold(q))
+    if not words:
+        return []
+    expr = " ".join(f'"{w}"*' for w in words)
+    rows = db().execute(
+        "SELECT e.question, e.tag, e.title FROM kb_fts JOIN kb_entries e ON e.id = kb_fts.rowid "
+        "WHERE kb_fts MATCH ? ORDER BY bm25(kb_fts, 2.0, 1.0, 0.0) LIMIT ?",
+        ("{question body} : (" + expr + ")", limit)
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
-# ✅ IMPORTANTE: garante DB mesmo no gunicorn/Render
-init_db()
+@lru_cache(maxsize=2048)
+def _answer_for(q: str, version: str) -> tuple:
+    """(html, match, pergunta da base, tag) — os dois últimos None sem resposta."""
+    entry, match = kb_lookup(q)
+    if entry is None or not entry["title"]:
+        return RESPOSTA_GERAL, "miss", None, None
+    html = entry["answer_html"] or _make_answer(
+        entry["title"], json.loads(entry["bullets"]), bool(entry["delicate"])
+    )
+    return html, match, entry["question"], entry["tag"]
+
+def generate_answer_for_question(q: str) -> str:
+    q = (q or "").strip()
+    html, match, _, _ = _answer_for(q, kb_version())
+    metrics.inc("answers_total", (("match", match),))
+    return html
+
+@lru_cache(maxsize=8)
+def _quick_questions(version: str) -> List[Dict[str, str]]:
+    rows = db().execute(
+        "SELECT question, tag FROM kb_entries WHERE quick = 1 ORDER BY position"
+    ).fetchall()
+    return [{"text": r["question"], "tag": r["tag"]} for r in rows]
+
+def get_quick_questions() -> List[Dict[str, str]]:
+    questions = _quick_questions(kb_version())
+    if not QUICK_BY_DEMAND:
+        return questions
+    # Ordem pela procura dos últimos QUICK_DEMAND_DAYS dias; empate (e
+    # pergunta nunca feita) mantém a posição da base. sorted é estável.
+    demand = top_counts("q", QUICK_DEMAND_DAYS, tuple(q["text"] for q in questions))
+    return sorted(questions, key=lambda q: -demand.get(q["text"], 0))
 
 # =====================================================
-# CONTRATO (PRESTAÇÃO DE SERVIÇOS ADVOCATÍCIOS)
+# CONTADORES DE PERGUNTAS E TAGS
 # =====================================================
-def gerar_contrato_advocacia(data: dict) -> str:
-    contratante = (data.get("contratante") or "CONTRATANTE").strip()
-    contratado = (data.get("contratado") or "CONTRATADO(A)").strip()
-    oab = (data.get("oab") or "OAB/UF XXXXX").strip()
-    foro = (data.get("foro") or "Comarca de __________________/UF").strip()
-
-    objeto = (data.get("objeto") or "Prestação de serviços advocatícios no tema: ____________________________.").strip()
-    honorarios = (data.get("honorarios") or "Honorários: R$ ________ (fixo) e/ou ________% (êxito), conforme condições abaixo.").strip()
-    despesas = (data.get("despesas") or "Custas, emolumentos e despesas correrão por conta do(a) CONTRATANTE, mediante prestação de contas.").strip()
-    comunicacao = (data.get("comunicacao") or "WhatsApp/E-mail").strip()
-    rescisao_extra = (data.get("rescisao") or "").strip()
-
-    rescisao_base = """RESCISÃO, RENÚNCIA E ENCERRAMENTO
-1. Qualquer das partes poderá rescindir este contrato, mediante comunicação por escrito.
-2. Em caso de rescisão pelo(a) CONTRATANTE, serão devidos os honorários proporcionais ao trabalho já realizado, além de despesas comprovadas.
-3. Em caso de renúncia pelo(a) CONTRATADO(A), serão adotadas as providências necessárias para evitar prejuízo ao(à) CONTRATANTE, incluindo comunicação formal, entrega de documentos essenciais e orientações de transição, respeitados os prazos e deveres profissionais.
+# Mantidos na mesma transação que grava o histórico: por pergunta (a da base
+# quando houve resposta; senão o texto normalizado) e por tag, em baldes
+# diários (d:AAAA-MM-DD): as janelas móveis somam os dias. Baldes antigos
+# saem na compactação do histórico.
+COUNTERS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS qa_counters (
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        period TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (kind, key, period)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS qa_counters_period ON qa_counters (kind, period, n);
 """
-    if rescisao_extra:
-        rescisao_base += f"\nCláusula adicional informada pelas partes:\n- {rescisao_extra}\n"
+QUICK_BY_DEMAND = os.environ.get("QUICK_BY_DEMAND", "1") == "1"
+QUICK_DEMAND_DAYS = int(os.environ.get("QUICK_DEMAND_DAYS", "30"))
+COUNTERS_TTL_S = float(os.environ.get("COUNTERS_TTL_S", "60"))
+COUNTERS_KEEP_DAYS = int(os.environ.get("COUNTERS_KEEP_DAYS", "400"))
+TRENDING_MAX_DAYS = 90
+TRENDING_MAX_LIMIT = 100
 
-    return f"""CONTRATO DE PRESTAÇÃO DE SERVIÇOS ADVOCATÍCIOS (MODELO)
+def _counter_keys(question: str) -> tuple:
+    _, _, entry_question, tag = _answer_for(question.strip(), kb_version())
+    return entry_question or " ".join(_TOKEN_RE.findall(_fold(question))), tag
 
-PARTES
-CONTRATANTE: {contratante}
-CONTRATADO(A): {contratado} — {oab}
+def _day_bucket(created_at: str):
+    try:
+        return f"d:{datetime.fromisoformat(created_at).date().isoformat()}"
+    except (TypeError, ValueError):
+        return None  # data legada, sem ano: fora das janelas
+
+def bump_counters(conn: sqlite3.Connection, items: List[tuple]):
+    """Soma (pergunta, created_at, n) aos contadores, dentro da transação de `conn`."""
+    counts = {}
+    for question, created_at, n in items:
+        period = _day_bucket(created_at)
+        if period is None:
+            continue
+        key, tag = _counter_keys(question or "")
+        counts[("q", key, period)] = counts.get(("q", key, period), 0) + n
+        if tag:
+            counts[("tag", tag, period)] = counts.get(("tag", tag, period), 0) + n
+    conn.executemany(
+        """INSERT INTO qa_counters (kind, key, period, n) VALUES (?,?,?,?)
+           ON CONFLICT (kind, key, period) DO UPDATE SET n = n + excluded.n""",
+        [(*k, n) for k, n in counts.items()]
+    )
+
+def _window_counts(kind: str, days: int, end: datetime, limit: int = None, keys=None) -> Dict[str, int]:
+    """Soma dos baldes diários da janela. Com `keys`, só essas chaves (pela
+    chave primária, sem varrer a janela inteira); sem `keys`, use `limit`."""
+    first = (end - timedelta(days=days - 1)).date().isoformat()
+    params = [kind, "d:" + first, "d:" + end.date().isoformat()]
+    where = ""
+    if keys is not None:
+        if not keys:
+            return {}
+        where = f"AND key IN ({','.join('?' * len(keys))})"
+        params += keys
+    if limit:
+        params.append(limit)
+    rows = db().execute(
+        f"""SELECT key, SUM(n) AS n FROM qa_counters
+            WHERE kind = ? AND period BETWEEN ? AND ? {where}
+            GROUP BY key ORDER BY n DESC {"LIMIT ?" if limit else ""}""",
+        params
+    ).fetchall()
+    return {r["key"]: r["n"] for r in rows}
+
+# Materializado por processo, por COUNTERS_TTL_S: (kind, dias) -> (expira_em,
+# chaves, contagens) e ("trending", kind, dias) -> (expira_em, None, itens).
+_top_cache = {}
+
+def top_counts(kind: str, days: int, keys: tuple) -> Dict[str, int]:
+    """Contagens de `keys` na janela móvel de `days` dias, recalculadas a cada
+    COUNTERS_TTL_S (ou quando as chaves mudam, com a base)."""
+    hit = _top_cache.get((kind, days))
+    if hit is not None and hit[0] > time.monotonic() and hit[1] == keys:
+        return hit[2]
+    counts = _window_counts(kind, days, datetime.now(), keys=list(keys))
+    _top_cache[(kind, days)] = (time.monotonic() + COUNTERS_TTL_S, keys, counts)
+    return counts
+
+def trending(kind: str, days: int, limit: int) -> List[dict]:
+    """Mais procurados na janela atual, com a janela anterior de mesmo tamanho.
+    Calcula o top TRENDING_MAX_LIMIT uma vez por COUNTERS_TTL_S e corta."""
+    hit = _top_cache.get(("trending", kind, days))
+    if hit is not None and hit[0] > time.monotonic():
+        return hit[2][:limit]
+    now = datetime.now()
+    current = _window_counts(kind, days, now, TRENDING_MAX_LIMIT)
+    previous = _window_counts(kind, days, now - timedelta(days=days), keys=list(current))
+    out = []
+    for key, n in current.items():
+        before = previous.get(key, 0)
+        out.append({
+            "key": key, "n": n, "anterior": before,
+            "variacao": round((n - before) / before, 3) if before else None,
+        })
+    _top_cache[("trending", kind, days)] = (time.monotonic() + COUNTERS_TTL_S, None, out)
+    return out[:limit]
+
+@app.cli.command("history-counters")
+def history_counters_command():
+    """Recalcula os contadores a partir do histórico inteiro."""
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM qa_counters")
+        rows = conn.execute(
+            "SELECT question, created_at, COUNT(*) AS n FROM qa_history GROUP BY question, substr(created_at, 1, 10)"
+        )
+        total = 0
+        for r in rows:
+            bump_counters(conn, [(r["question"], r["created_at"], r["n"])])
+            total += r["n"]
+    _top_cache.clear()
+    click.echo(f"{total} perguntas contadas.")
+
+@app.cli.command("kb-import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def kb_import_command(path):
+    """Importa a base de conhecimento de um JSON (substitui a atual)."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    version = kb_import(db(), data)
+    click.echo(f"{len(data.get('entries') or [])} entradas importadas (versão {version}).")
+
+@app.cli.command("kb-export")
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+def kb_export_command(path):
+    """Exporta a base de conhecimento para JSON."""
+    data = kb_export(db())
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    click.echo(f"{len(data['entries'])} entradas exportadas.")
+
+# ✅ IMPORTANTE: o schema não é mais criado no import. ensure_db() roda no
+# master do gunicorn (gunicorn.conf.py) ou, sem ele, na primeira conexão.
 
-1) OBJETO
-1.1. O presente contrato tem por objeto {objeto}
-1.2. O serviço observa a legislação aplicável, o Código de Ética e Disciplina e a independência técnica do(a) CONTRATADO(A).
+def warm_up():
+    """Compila os templates e prepara o modelo DOCX antes do fork, para os
+    workers herdarem tudo pronto (a primeira renderização da home custava
+    ~25 ms de compilação Jinja em cada worker). Não abre conexões."""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    _docx_template()
 
-2) ESCOPO, LIMITES E ATOS INCLUÍDOS
-2.1. Inclui-se, em regra, conforme a natureza do serviço:
+# =====================================================
+# CONTRATO (PRESTAÇÃO DE SERVIÇOS ADVOCATÍCIOS)
+# =====================================================
+# Biblioteca de cláusulas: cada modelo é uma lista de cláusulas ({n} vira o
+# número da cláusula no modelo) mais os textos padrão dos campos. O texto de
+# cada modelo é separado uma vez, no import, em trechos fixos e campos; gerar
+# um contrato é só juntar os trechos com os valores, e entradas repetidas
+# (prévia enquanto se digita, DOCX logo depois) saem de um cache.
+CONTRATO_MEMO_SIZE = int(os.environ.get("CONTRATO_MEMO_SIZE", "256"))
+CONTRATO_MEMO_MAX_CHARS = 8000
+
+CLAUSULAS = {
+    "partes": """PARTES
+CONTRATANTE: {contratante}
+CONTRATADO(A): {contratado} — {oab}""",
+    "objeto": """{n}) OBJETO
+{n}.1. O presente contrato tem por objeto {objeto}
+{n}.2. O serviço observa a legislação aplicável, o Código de Ética e Disciplina e a independência técnica do(a) CONTRATADO(A).""",
+    "escopo": """{n}) ESCOPO, LIMITES E ATOS INCLUÍDOS
+{n}.1. Inclui-se, em regra, conforme a natureza do serviço:
 (a) reunião/consulta inicial e definição de estratégia;
 (b) análise de documentos fornecidos;
 (c) elaboração de peças e manifestações necessárias ao objeto;
 (d) acompanhamento do andamento e comunicação de eventos relevantes.
-2.2. NÃO estão incluídos, salvo ajuste escrito específico:
+{n}.2. NÃO estão incluídos, salvo ajuste escrito específico:
 (a) propositura de novas demandas não previstas no objeto;
 (b) recursos em qualquer instância/tribunal;
 (c) sustentações orais, memoriais, despachos presenciais;
 (d) diligências externas, viagens, audiências extras ou incidentes não previstos;
 (e) perícias/assistência técnica especializada fora do escopo.
-2.3. Caso surjam medidas não previstas, as partes poderão firmar aditivo com novo escopo e honorários.
-
-3) DEVERES DO(A) CONTRATANTE
-3.1. Fornecer informações verdadeiras, completas e documentos necessários, respondendo por omissões que possam comprometer a atuação.
-3.2. Manter canais de contato atualizados e atender solicitações em prazo compatível com urgências e prazos.
-3.3. Realizar pagamentos pactuados e reembolsar despesas, conforme previsto.
-
-4) HONORÁRIOS
-4.1. As partes ajustam: {honorarios}
-4.2. Honorários podem ser fixos, por fase/etapa ou por êxito (quando aplicável).
-4.3. Honorários de êxito (se aplicáveis):
+{n}.3. Caso surjam medidas não previstas, as partes poderão firmar aditivo com novo escopo e honorários.""",
+    "escopo_trabalhista": """{n}) ESCOPO, LIMITES E ATOS INCLUÍDOS
+{n}.1. Inclui-se, em regra:
+(a) reunião inicial, análise de documentos (CTPS, contracheques, termo de rescisão, cartões de ponto) e cálculo estimativo dos pedidos;
+(b) elaboração da petição inicial e das manifestações perante a Vara do Trabalho;
+(c) comparecimento às audiências de conciliação, instrução e julgamento;
+(d) acompanhamento da liquidação e da execução até o levantamento dos valores.
+{n}.2. NÃO estão incluídos, salvo ajuste escrito específico:
+(a) recursos ao Tribunal Regional do Trabalho e ao Tribunal Superior do Trabalho;
+(b) ações conexas (previdenciárias, cíveis ou criminais) decorrentes dos mesmos fatos;
+(c) assistência técnica em perícias (insalubridade, periculosidade, médica);
+(d) diligências e audiências fora da comarca.
+{n}.3. Caso surjam medidas não previstas, as partes poderão firmar aditivo com novo escopo e honorários.""",
+    "deveres": """{n}) DEVERES DO(A) CONTRATANTE
+{n}.1. Fornecer informações verdadeiras, completas e documentos necessários, respondendo por omissões que possam comprometer a atuação.
+{n}.2. Manter canais de contato atualizados e atender solicitações em prazo compatível com urgências e prazos.
+{n}.3. Realizar pagamentos pactuados e reembolsar despesas, conforme previsto.""",
+    "honorarios": """{n}) HONORÁRIOS
+{n}.1. As partes ajustam: {honorarios}
+{n}.2. Honorários podem ser fixos, por fase/etapa ou por êxito (quando aplicável).
+{n}.3. Honorários de êxito (se aplicáveis):
 (a) incidem sobre o benefício econômico efetivamente obtido pelo(a) CONTRATANTE;
 (b) são devidos em acordo, sentença, recebimento administrativo, compensação ou forma equivalente;
 (c) se houver acordo sem participação do(a) CONTRATADO(A), poderão ser devidos conforme atuação já realizada, conforme pactuação.
-4.4. Honorários de sucumbência:
+{n}.4. Honorários de sucumbência:
 (a) quando fixados em favor do(a) advogado(a), pertencem ao(à) CONTRATADO(A), sem prejuízo dos honorários contratuais, salvo ajuste expresso em contrário.
-4.5. Atraso e inadimplência:
+{n}.5. Atraso e inadimplência:
 (a) a falta de pagamento autoriza suspensão de atos não urgentes, com comunicação ao(à) CONTRATANTE;
-(b) cobranças devem observar urbanidade e discrição, sem exposição.
+(b) cobranças devem observar urbanidade e discrição, sem exposição.""",
+    "honorarios_trabalhista": """{n}) HONORÁRIOS
+{n}.1. As partes ajustam: {honorarios}
+{n}.2. O percentual de êxito incide sobre o valor bruto efetivamente recebido pelo(a) CONTRATANTE, em acordo, sentença ou execução, e é pago a cada levantamento.
+{n}.3. Os honorários de sucumbência fixados pela Justiça do Trabalho (art. 791-A da CLT) pertencem ao(à) CONTRATADO(A), sem prejuízo dos honorários contratuais, salvo ajuste expresso em contrário.
+{n}.4. Somados, honorários contratuais e de sucumbência não podem superar as vantagens obtidas pelo(a) CONTRATANTE (art. 50 do Código de Ética e Disciplina).
+{n}.5. Havendo acordo sem participação do(a) CONTRATADO(A) ou revogação do mandato, serão devidos honorários proporcionais ao trabalho já realizado.
+{n}.6. Cobranças devem observar urbanidade e discrição, sem exposição.""",
+    "despesas": """{n}) DESPESAS, CUSTAS E REEMBOLSO
+{n}.1. {despesas}
+{n}.2. Despesas incluem: custas, emolumentos, diligências, cópias, autenticações, deslocamentos, correspondentes e taxas.
+{n}.3. Sempre que possível, o(a) CONTRATADO(A) informará previamente despesas relevantes. Em urgência, poderão ser realizadas para evitar prejuízo, com posterior prestação de contas.""",
+    "comunicacao": """{n}) COMUNICAÇÃO E ATUALIZAÇÕES
+{n}.1. Canal preferencial: {comunicacao}
+{n}.2. O(a) CONTRATADO(A) comunicará eventos relevantes e necessidades de documentos.
+{n}.3. Mensagens são voltadas à logística e atualizações; análises extensas serão priorizadas em reunião/consulta.""",
+    "confidencialidade": """{n}) CONFIDENCIALIDADE E PROTEÇÃO DE DADOS
+{n}.1. As partes se comprometem a manter sigilo sobre informações e documentos relacionados ao caso.
+{n}.2. Dados e documentos serão tratados estritamente para execução do contrato e cumprimento de deveres profissionais/legais.
+{n}.3. Adotam-se medidas razoáveis de segurança (controle de acesso, armazenamento adequado e descarte seguro).""",
+    "independencia": """{n}) INDEPENDÊNCIA TÉCNICA
+{n}.1. O(a) CONTRATADO(A) atuará com independência técnica, não se comprometendo com resultado específico.""",
+    "prazo": """{n}) PRAZO
+{n}.1. Vigência a partir da assinatura até a conclusão do objeto, rescisão ou encerramento.""",
+    "rescisao": """{n}) RESCISÃO, RENÚNCIA E ENCERRAMENTO
+1. Qualquer das partes poderá rescindir este contrato, mediante comunicação por escrito.
+2. Em caso de rescisão pelo(a) CONTRATANTE, serão devidos os honorários proporcionais ao trabalho já realizado, além de despesas comprovadas.
+3. Em caso de renúncia pelo(a) CONTRATADO(A), serão adotadas as providências necessárias para evitar prejuízo ao(à) CONTRATANTE, incluindo comunicação formal, entrega de documentos essenciais e orientações de transição, respeitados os prazos e deveres profissionais.
+{rescisao_adicional}""",
+    "foro": """{n}) FORO
+{n}.1. Fica eleito o foro da {foro}, com renúncia a qualquer outro, para dirimir controvérsias decorrentes deste contrato.""",
+    "assinaturas": """E, por estarem de acordo, as partes firmam o presente instrumento.
 
-5) DESPESAS, CUSTAS E REEMBOLSO
-5.1. {despesas}
-5.2. Despesas incluem: custas, emolumentos, diligências, cópias, autenticações, deslocamentos, correspondentes e taxas.
-5.3. Sempre que possível, o(a) CONTRATADO(A) informará previamente despesas relevantes. Em urgência, poderão ser realizadas para evitar prejuízo, com posterior prestação de contas.
+Local e data: ______________________________
 
-6) COMUNICAÇÃO E ATUALIZAÇÕES
-6.1. Canal preferencial: {comunicacao}
-6.2. O(a) CONTRATADO(A) comunicará eventos relevantes e necessidades de documentos.
-6.3. Mensagens são voltadas à logística e atualizações; análises extensas serão priorizadas em reunião/consulta.
+CONTRATANTE: ______________________________
 
-7) CONFIDENCIALIDADE E PROTEÇÃO DE DADOS
-7.1. As partes se comprometem a manter sigilo sobre informações e documentos relacionados ao caso.
-7.2. Dados e documentos serão tratados estritamente para execução do contrato e cumprimento de deveres profissionais/legais.
-7.3. Adotam-se medidas razoáveis de segurança (controle de acesso, armazenamento adequado e descarte seguro).
+CONTRATADO(A): ______________________________
+""",
+}
 
-8) INDEPENDÊNCIA TÉCNICA
-8.1. O(a) CONTRATADO(A) atuará com independência técnica, não se comprometendo com resultado específico.
+_CONTRATO_PADROES = {
+    "contratante": "CONTRATANTE",
+    "contratado": "CONTRATADO(A)",
+    "oab": "OAB/UF XXXXX",
+    "foro": "Comarca de __________________/UF",
+    "objeto": "Prestação de serviços advocatícios no tema: ____________________________.",
+    "honorarios": "Honorários: R$ ________ (fixo) e/ou ________% (êxito), conforme condições abaixo.",
+    "despesas": "Custas, emolumentos e despesas correrão por conta do(a) CONTRATANTE, mediante prestação de contas.",
+    "comunicacao": "WhatsApp/E-mail",
+    "rescisao": "",
+}
 
-9) PRAZO
-9.1. Vigência a partir da assinatura até a conclusão do objeto, rescisão ou encerramento.
+# "numeradas" recebem 1), 2)...; "abertura"/"fecho" vêm antes/depois delas.
+CONTRATO_MODELOS = {
+    "civil": {
+        "nome": "Prestação de serviços advocatícios",
+        "titulo": "Contrato de Prestação de Serviços Advocatícios",
+        "arquivo": "contrato_servicos_advocaticios",
+        "cabecalho": "CONTRATO DE PRESTAÇÃO DE SERVIÇOS ADVOCATÍCIOS (MODELO)",
+        "abertura": ["partes"],
+        "numeradas": ["objeto", "escopo", "deveres", "honorarios", "despesas", "comunicacao",
+                      "confidencialidade", "independencia", "prazo", "rescisao", "foro"],
+        "fecho": ["assinaturas"],
+        "padroes": _CONTRATO_PADROES,
+    },
+    "trabalhista": {
+        "nome": "Reclamação trabalhista (êxito)",
+        "titulo": "Contrato de Honorários — Reclamação Trabalhista",
+        "arquivo": "contrato_honorarios_trabalhista",
+        "cabecalho": "CONTRATO DE PRESTAÇÃO DE SERVIÇOS ADVOCATÍCIOS — RECLAMAÇÃO TRABALHISTA (MODELO)",
+        "abertura": ["partes"],
+        "numeradas": ["objeto", "escopo_trabalhista", "deveres", "honorarios_trabalhista", "despesas",
+                      "comunicacao", "confidencialidade", "independencia", "prazo", "rescisao", "foro"],
+        "fecho": ["assinaturas"],
+        "padroes": dict(
+            _CONTRATO_PADROES,
+            objeto="Patrocínio de reclamação trabalhista em face de ____________________________, perante a Justiça do Trabalho.",
+            honorarios="Honorários: ________% (êxito) sobre o valor recebido pelo(a) CONTRATANTE, conforme condições abaixo.",
+            despesas="Custas, perícias e despesas, quando devidas e não cobertas pela justiça gratuita, correrão por conta do(a) CONTRATANTE, mediante prestação de contas.",
+        ),
+    },
+}
+CONTRATO_MODELO_PADRAO = "civil"
+CONTRATO_DOC_TITLE = CONTRATO_MODELOS[CONTRATO_MODELO_PADRAO]["titulo"]
 
-10) {rescisao_base}
+class ContractTemplate:
+    """Texto com {campos}, separado uma vez em trechos fixos e nomes de campo."""
 
-11) FORO
-11.1. Fica eleito o foro da {foro}, com renúncia a qualquer outro, para dirimir controvérsias decorrentes deste contrato.
+    def __init__(self, text: str):
+        self.parts: List[str] = []  # fixo, campo, fixo, campo, ..., fixo
+        literal = ""
+        for lit, field, _spec, _conv in string.Formatter().parse(text):
+            literal += lit
+            if field is not None:
+                self.parts += [literal, field]
+                literal = ""
+        self.parts.append(literal)
+        self.fields = tuple(dict.fromkeys(self.parts[1::2]))
 
-E, por estarem de acordo, as partes firmam o presente instrumento.
+    def render(self, values: dict) -> str:
+        out = self.parts[:]
+        for i in range(1, len(out), 2):
+            out[i] = values[out[i]]
+        return "".join(out)
 
-Local e data: ______________________________
+def _compile_modelo(modelo: dict) -> ContractTemplate:
+    blocks = [modelo["cabecalho"]] + [CLAUSULAS[c] for c in modelo["abertura"]]
+    for n, c in enumerate(modelo["numeradas"], start=1):
+        blocks.append(CLAUSULAS[c].replace("{n}", str(n)))
+    blocks += [CLAUSULAS[c] for c in modelo["fecho"]]
+    return ContractTemplate("\n\n".join(blocks))
 
-CONTRATANTE: ______________________________
+_contrato_templates = {nome: _compile_modelo(m) for nome, m in CONTRATO_MODELOS.items()}
 
-CONTRATADO(A): ______________________________
-"""
+def contrato_modelo(nome: str = None) -> str:
+    """Nome do modelo validado (vazio = padrão); ValueError se não existir."""
+    nome = (nome or "").strip() or CONTRATO_MODELO_PADRAO
+    if nome not in CONTRATO_MODELOS:
+        raise ValueError(f"modelo desconhecido: {nome} (use {', '.join(CONTRATO_MODELOS)})")
+    return nome
+
+def _contrato_valores(nome: str, data) -> tuple:
+    # Mesma normalização de antes: vazio/ausente vira o padrão, depois strip.
+    padroes = CONTRATO_MODELOS[nome]["padroes"]
+    return tuple((data.get(campo) or padrao).strip() for campo, padrao in padroes.items())
+
+def _render_contrato(nome: str, valores: tuple) -> str:
+    values = dict(zip(CONTRATO_MODELOS[nome]["padroes"], valores))
+    extra = values["rescisao"]
+    values["rescisao_adicional"] = f"\nCláusula adicional informada pelas partes:\n- {extra}\n" if extra else ""
+    return _contrato_templates[nome].render(values)
+
+_render_contrato_memo = lru_cache(maxsize=CONTRATO_MEMO_SIZE)(_render_contrato)
+
+def gerar_contrato(data, modelo: str = None) -> str:
+    """Texto do contrato; `modelo` (ou data["modelo"]) escolhe o conjunto de cláusulas."""
+    nome = contrato_modelo(modelo or data.get("modelo"))
+    valores = _contrato_valores(nome, data)
+    if sum(map(len, valores)) > CONTRATO_MEMO_MAX_CHARS:
+        return _render_contrato(nome, valores)
+    return _render_contrato_memo(nome, valores)
+
+def gerar_contrato_advocacia(data: dict) -> str:
+    return gerar_contrato(data, CONTRATO_MODELO_PADRAO)
 
 # =====================================================
 # DOCX DOWNLOAD
@@ -439,18 +1744,134 @@ def _sanitize_filename(name: str) -> str:
     cleaned = "".join([c if c in keep else "_" for c in (name or "")]).strip()
     return cleaned[:80] if cleaned else "documento"
 
-def _make_docx_bytes(title: str, text: str) -> BytesIO:
+# O mesmo contrato é baixado várias vezes: guardamos os bytes prontos num LRU
+# limitado por tamanho, chaveado pelo hash de (título, texto).
+DOCX_CACHE_MAX_BYTES = int(os.environ.get("DOCX_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Caminho rápido: em vez do modelo de objetos do python-docx, monta só o
+# word/document.xml e o anexa a um pacote pré-montado a partir do modelo
+# padrão do próprio python-docx (mesmos estilos e metadados).
+DOCX_FAST_PATH = os.environ.get("DOCX_FAST_PATH", "1") == "1"
+DOCX_MIMETYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+class BytesLRU:
+    """LRU limitado pela soma dos tamanhos (len do valor, ou `size` informado)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def put(self, key: str, value, size: int = None):
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._data[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.size -= evicted
+
+_docx_cache = BytesLRU(DOCX_CACHE_MAX_BYTES)
+
+def _docx_lines(text: str) -> List[str]:
+    return (text or "").replace("\r\n", "\n").split("\n")
+
+def _build_docx_python_docx(title: str, text: str) -> bytes:
+    # Import tardio: python-docx (e o lxml) custam ~70 ms no boot de cada
+    # worker e só este caminho (DOCX_FAST_PATH=0) precisa deles.
+    from docx import Document
+
     doc = Document()
     if title:
         doc.add_heading(title, level=1)
 
-    for line in (text or "").replace("\r\n", "\n").split("\n"):
+    for line in _docx_lines(text):
         doc.add_paragraph(line)
 
     bio = BytesIO()
     doc.save(bio)
-    bio.seek(0)
-    return bio
+    return bio.getvalue()
+
+@lru_cache(maxsize=1)
+def _docx_template():
+    """(pacote sem document.xml, início do document.xml, fim do document.xml)."""
+    # Só o arquivo do pacote; localizado sem importar o python-docx.
+    pkg_dir = importlib.util.find_spec("docx").submodule_search_locations[0]
+    path = os.path.join(pkg_dir, "templates", "default.docx")
+    prefix = BytesIO()
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(prefix, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            if info.filename == "word/document.xml":
+                document_xml = src.read(info).decode("utf-8")
+            else:
+                dst.writestr(info.filename, src.read(info))
+    body = document_xml.index("<w:body>") + len("<w:body>")
+    sect = document_xml.index("<w:sectPr", body)
+    return prefix.getvalue(), document_xml[:body], document_xml[sect:]
+
+# Caracteres de controle não são XML válido (o python-docx recusa o texto).
+_XML_INVALID_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def _xml_escape(text: str) -> str:
+    # O mesmo que xml.sax.saxutils.escape, sem importar xml.sax/urllib no boot.
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def _ooxml_run(text: str) -> str:
+    # Mesma conversão do python-docx: tab -> <w:tab/>, \r solto -> <w:br/>.
+    parts = []
+    for chunk in re.split(r"([\t\r])", _XML_INVALID_RE.sub("", text)):
+        if chunk == "\t":
+            parts.append("<w:tab/>")
+        elif chunk == "\r":
+            parts.append("<w:br/>")
+        elif chunk:
+            parts.append(f'<w:t xml:space="preserve">{_xml_escape(chunk)}</w:t>')
+    return "<w:r>" + "".join(parts) + "</w:r>" if parts else ""
+
+def _build_docx_ooxml(title: str, text: str) -> bytes:
+    prefix, head, tail = _docx_template()
+    out = [head]
+    if title:
+        out.append(f'<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr>{_ooxml_run(title)}</w:p>')
+    for line in _docx_lines(text):
+        run = _ooxml_run(line)
+        out.append(f"<w:p>{run}</w:p>" if run else "<w:p/>")
+    out.append(tail)
+    bio = BytesIO(prefix)
+    bio.seek(0, os.SEEK_END)
+    with zipfile.ZipFile(bio, "a", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("word/document.xml", "".join(out))
+    return bio.getvalue()
+
+def _build_docx(title: str, text: str) -> bytes:
+    if DOCX_FAST_PATH:
+        return _build_docx_ooxml(title, text)
+    return _build_docx_python_docx(title, text)
+
+def _make_docx_bytes(title: str, text: str) -> BytesIO:
+    key = hashlib.sha256("\0".join([title or "", "\n".join(_docx_lines(text))]).encode("utf-8")).hexdigest()
+    data = _docx_cache.get(key)
+    metrics.inc("docx_cache_total", (("result", "hit" if data is not None else "miss"),))
+    if data is None:
+        t0 = time.perf_counter()
+        data = _build_docx(title, text)
+        metrics.observe("docx_build_duration_seconds", (), time.perf_counter() - t0, LATENCY_BUCKETS)
+        metrics.observe("docx_bytes", (), len(data), BYTES_BUCKETS)
+        _docx_cache.put(key, data)
+    return BytesIO(data)
 
 @app.route("/download-docx", methods=["POST"])
 def download_docx():
@@ -467,9 +1888,244 @@ def download_docx():
         bio,
         as_attachment=True,
         download_name=f"{filename}.docx",
-        mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        mimetype=DOCX_MIMETYPE
+    )
+
+# =====================================================
+# CONTRATOS EM LOTE (ZIP EM STREAMING)
+# =====================================================
+# POST /contrato/lote recebe uma lista de campos de gerar_contrato()
+# (CSV ou JSON), renderiza cada DOCX num pool de processos e devolve um ZIP
+# em streaming: cada arquivo vai para a resposta assim que fica pronto. No
+# máximo BATCH_IN_FLIGHT contratos ficam em memória ao mesmo tempo.
+CONTRATO_FIELDS = (
+    "contratante", "contratado", "oab", "foro", "objeto",
+    "honorarios", "despesas", "comunicacao", "rescisao", "modelo",
+)
+BATCH_MAX_ROWS = int(os.environ.get("BATCH_MAX_ROWS", "5000"))
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", str(20 * 1024 * 1024)))
+BATCH_FIELD_MAX_CHARS = 20000
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", str(os.cpu_count() or 1)))
+BATCH_IN_FLIGHT = BATCH_WORKERS * 4
+
+_pool_state = {"pool": None, "pid": None}
+
+def _contract_pool():
+    if _pool_state["pid"] != os.getpid() or _pool_state["pool"] is None:
+        with _start_lock:
+            if _pool_state["pid"] != os.getpid() or _pool_state["pool"] is None:
+                from concurrent.futures import ProcessPoolExecutor  # só no primeiro lote
+                _pool_state["pool"] = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+                _pool_state["pid"] = os.getpid()
+                atexit.register(_pool_state["pool"].shutdown, wait=False, cancel_futures=True)
+    return _pool_state["pool"]
+
+def _render_contract_docx(fields: dict) -> bytes:
+    # Roda no processo do pool: sem banco; gerar_contrato usa o memo do
+    # próprio processo (cada worker do pool tem o seu).
+    nome = contrato_modelo(fields.get("modelo"))
+    return _build_docx(CONTRATO_MODELOS[nome]["titulo"], gerar_contrato(fields, nome))
+
+def _clean_contract_row(row) -> dict:
+    if not isinstance(row, dict):
+        raise ValueError("linha deve ser um objeto com os campos do contrato")
+    fields = {}
+    for name in CONTRATO_FIELDS:
+        value = row.get(name)
+        if value is None:
+            continue
+        if isinstance(value, (dict, list)):
+            raise ValueError(f"campo '{name}' deve ser texto")
+        value = str(value)
+        if len(value) > BATCH_FIELD_MAX_CHARS:
+            raise ValueError(f"campo '{name}' excede {BATCH_FIELD_MAX_CHARS} caracteres")
+        fields[name] = value
+    contrato_modelo(fields.get("modelo"))
+    return fields
+
+def _batch_rows(upload, payload):
+    """(total de linhas, iterador de linhas) a partir do upload ou do JSON."""
+    if payload is not None:
+        rows = payload.get("contratos") if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise ValueError("envie uma lista de contratos (ou {\"contratos\": [...]})")
+        return len(rows), iter(rows)
+    name = (upload.filename or "").lower()
+    if name.endswith(".json"):
+        return _batch_rows(None, json.load(upload.stream))
+    # CSV: copia para um arquivo temporário nosso (o upload é fechado quando
+    # a view retorna, antes do streaming), conta as linhas numa passada e
+    # relê linha a linha, sem carregar tudo em memória.
+    spool = tempfile.TemporaryFile()
+    shutil.copyfileobj(upload.stream, spool)
+    spool.seek(0)
+    text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    total = sum(1 for _ in csv.DictReader(text))
+    text.seek(0)
+    return total, csv.DictReader(text)
+
+class _ZipStream(io.RawIOBase):
+    """Destino não-posicionável para o zipfile: acumula bytes até o próximo drain()."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _stream_contracts_zip(rows):
+    from concurrent.futures import FIRST_COMPLETED, wait
+    out = _ZipStream()
+    errors = []
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        pool = _contract_pool()
+        in_flight = {}
+
+        def collect(done):
+            for fut in done:
+                n, name = in_flight.pop(fut)
+                try:
+                    z.writestr(f"{n:05d}_{name}.docx", fut.result())
+                except Exception as e:
+                    errors.append((n, f"falha ao gerar: {e}"))
+
+        for n, row in enumerate(rows, start=1):
+            try:
+                fields = _clean_contract_row(row)
+            except ValueError as e:
+                errors.append((n, str(e)))
+                continue
+            name = _sanitize_filename(fields.get("contratante") or "contrato")
+            in_flight[pool.submit(_render_contract_docx, fields)] = (n, name)
+            if len(in_flight) >= BATCH_IN_FLIGHT:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+                yield out.drain()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+            yield out.drain()
+        if errors:
+            report = io.StringIO()
+            w = csv.writer(report)
+            w.writerow(["linha", "erro"])
+            w.writerows(sorted(errors))
+            z.writestr("erros.csv", report.getvalue())
+    yield out.drain()
+
+@app.route("/contrato/lote", methods=["POST"])
+def contrato_lote():
+    if (request.content_length or 0) > BATCH_MAX_BYTES:
+        return jsonify({"ok": False, "error": f"envio maior que {BATCH_MAX_BYTES} bytes"}), 413
+    upload = request.files.get("arquivo")
+    payload = None if upload else request.get_json(silent=True)
+    if upload is None and payload is None:
+        return jsonify({"ok": False, "error": "envie 'arquivo' (CSV/JSON) ou um corpo JSON"}), 400
+    try:
+        total, rows = _batch_rows(upload, payload)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"ok": False, "error": f"entrada inválida: {e}"}), 400
+    if total == 0:
+        return jsonify({"ok": False, "error": "nenhum contrato na entrada"}), 400
+    if total > BATCH_MAX_ROWS:
+        return jsonify({"ok": False, "error": f"máximo de {BATCH_MAX_ROWS} contratos por lote"}), 413
+    return Response(
+        stream_with_context(_stream_contracts_zip(rows)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": "attachment; filename=contratos.zip"},
     )
 
+# =====================================================
+# CACHE HTTP (ETAG + RESPOSTAS RENDERIZADAS)
+# =====================================================
+# /qa, /recursos e o GET de /contrato só dependem da entrada, da base de
+# conhecimento e do código/templates. O ETag forte é o hash disso tudo: um
+# If-None-Match igual vira 304 sem renderizar nada, e o corpo renderizado fica
+# num LRU em memória para os demais acessos.
+HTTP_CACHE = os.environ.get("HTTP_CACHE", "1") == "1"
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+_response_cache = BytesLRU(RESPONSE_CACHE_MAX_BYTES)
+
+def _build_fingerprint() -> str:
+    h = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    rels = ["app.py"]
+    for d in ("templates", "static"):
+        # Recursivo e só arquivos: subpastas (static/img/...) entram pelo conteúdo.
+        for dirpath, _, names in os.walk(os.path.join(root, d)):
+            rels += [os.path.relpath(os.path.join(dirpath, n), root) for n in names]
+    for rel in sorted(rels):
+        with open(os.path.join(root, rel), "rb") as f:
+            h.update(rel.encode() + b"\0" + f.read())
+    return h.hexdigest()
+
+BUILD_FINGERPRINT = _build_fingerprint()
+
+def http_cache_key(path: str, values: List[str], version: str = None) -> str:
+    """Chave do cache de respostas (e ETag, nos 32 primeiros caracteres)."""
+    parts = [BUILD_FINGERPRINT, path] + values
+    if version is not None:
+        parts.append(version)
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+def http_cache(max_age: int, args=(), kb: bool = False):
+    """Cache de GET: ETag forte, 304, Cache-Control e corpo renderizado em memória.
+
+    `args` são os parâmetros de query que mudam a resposta; `kb` indica que a
+    resposta depende da base de conhecimento (entra a versão no ETag).
+    """
+    def deco(view):
+        @wraps(view)
+        def wrapper(*a, **kw):
+            # Com cookie de sessão pode haver flash na página: não cacheia.
+            if (not HTTP_CACHE or request.method != "GET"
+                    or app.config["SESSION_COOKIE_NAME"] in request.cookies):
+                return view(*a, **kw)
+            key = http_cache_key(
+                request.path,
+                [f"{k}={(request.args.get(k) or '').strip()}" for k in args],
+                (kb_version() or "") if kb else None,
+            )
+            etag = key[:32]
+            cache_control = f"public, max-age={max_age}"
+
+            if request.if_none_match.contains(etag):
+                resp = Response(status=304)
+            else:
+                cached = _response_cache.get(key)
+                if cached is not None:
+                    mimetype, body, vary = cached
+                    resp = Response(body, mimetype=mimetype)
+                    if vary:
+                        resp.headers["Vary"] = vary
+                else:
+                    resp = make_response(view(*a, **kw))
+                    if resp.status_code != 200 or resp.is_streamed:
+                        return resp
+                    body = resp.get_data()
+                    entry = (resp.mimetype, body, resp.headers.get("Vary"))
+                    _response_cache.put(key, entry, size=len(body))
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = cache_control
+            return resp
+        return wrapper
+    return deco
+
 # =====================================================
 # ROTAS
 # =====================================================
@@ -482,15 +2138,45 @@ def home():
             answer = generate_answer_for_question(q)
             save_history(q, answer)
 
+    before = request.args.get("antes", type=int)
+    history = get_history(HISTORY_RECENT_CACHE, before)
     return render_template(
         "home.html",
         app_name=APP_NAME,
-        history=get_history(50),
+        history=history,
+        history_before=before,
+        history_next=_history_next(history, HISTORY_RECENT_CACHE),
         answer=answer,
-        questions=QUICK_QUESTIONS,
+        questions=get_quick_questions(),
     )
 
+def _history_next(history: List[dict], limit: int):
+    # Página cheia: o id do último item gravado é o cursor da próxima (os
+    # pendentes do write-behind ficam no topo e ainda não têm id).
+    if len(history) < limit:
+        return None
+    return next((h["id"] for h in reversed(history) if h["id"] is not None), None)
+
+@app.template_filter("data_hora")
+def data_hora(value):
+    try:
+        return datetime.fromisoformat(value).strftime("%d/%m/%Y %H:%M")
+    except (TypeError, ValueError):
+        return value or ""
+
+@app.route("/historico", methods=["GET"])
+def historico():
+    limit = min(max(request.args.get("limite", 50, type=int), 1), HISTORY_PAGE_MAX)
+    # JSON só com linhas gravadas: todo id é um cursor válido.
+    history = get_history(limit, request.args.get("antes", type=int), include_pending=False)
+    return jsonify({
+        "ok": True,
+        "items": [{"id": h["id"], "question": h["question"], "created_at": h["created_at"]} for h in history],
+        "next": _history_next(history, limit),
+    })
+
 @app.route("/qa", methods=["GET"])
+@http_cache(max_age=300, args=("q",), kb=True)
 def qa_get():
     q = (request.args.get("q") or "").strip()
     if not q:
@@ -498,16 +2184,318 @@ def qa_get():
     html = generate_answer_for_question(q)
     return jsonify({"ok": True, "question": q, "answer_html": html})
 
+QA_BATCH_MAX = int(os.environ.get("QA_BATCH_MAX", "500"))
+QA_QUESTION_MAX_CHARS = 1000
+QA_BATCH_MAX_BYTES = 1024 * 1024
+
+def _qa_item(q) -> dict:
+    q = (q if isinstance(q, str) else "").strip()
+    if not q:
+        return {"ok": False, "error": "missing q"}
+    if len(q) > QA_QUESTION_MAX_CHARS:
+        return {"ok": False, "error": f"q longer than {QA_QUESTION_MAX_CHARS} chars"}
+    return {"ok": True, "question": q, "answer_html": generate_answer_for_question(q)}
+
+@app.route("/qa/lote", methods=["POST"])
+def qa_lote():
+    if (request.content_length or 0) > QA_BATCH_MAX_BYTES:
+        return jsonify({"ok": False, "error": f"body larger than {QA_BATCH_MAX_BYTES} bytes"}), 413
+    payload = request.get_json(silent=True)
+    questions = payload.get("questions") if isinstance(payload, dict) else None
+    if not isinstance(questions, list) or not questions:
+        return jsonify({"ok": False, "error": "missing questions"}), 400
+    if len(questions) > QA_BATCH_MAX:
+        return jsonify({"ok": False, "error": f"max {QA_BATCH_MAX} questions"}), 413
+    record = bool(payload.get("record"))
+    stream = bool(payload.get("stream")) or request.accept_mimetypes.best == "application/x-ndjson"
+
+    def results():
+        answered = []
+        for i, q in enumerate(questions):
+            item = dict(_qa_item(q), index=i)
+            if item["ok"]:
+                answered.append((item["question"], item["answer_html"]))
+            yield item
+        if record and answered:
+            save_history_many(answered)
+
+    if stream:
+        lines = (json.dumps(item, ensure_ascii=False) + "\n" for item in results())
+        return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+    return jsonify({"ok": True, "results": list(results())})
+
+@app.route("/kb/busca", methods=["GET"])
+def kb_busca():
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"ok": False, "error": "missing q"}), 400
+    return jsonify({"ok": True, "q": q, "results": kb_search(q)})
+
+def _date_arg(name: str, end: bool = False):
+    return _parse_date(request.args.get(name), end)  # ValueError -> 400
+
+@app.route("/historico/busca", methods=["GET"])
+def historico_busca():
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"ok": False, "error": "missing q"}), 400
+    order = request.args.get("ordem", "recentes")
+    if order not in ("recentes", "relevancia"):
+        return jsonify({"ok": False, "error": "ordem must be recentes or relevancia"}), 400
+    try:
+        since, until = _date_arg("de"), _date_arg("ate", end=True)
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid date (use YYYY-MM-DD)"}), 400
+    limit = min(max(request.args.get("limite", 50, type=int), 1), HISTORY_PAGE_MAX)
+    items = search_history(q, since, until, order, limit, request.args.get("antes", type=int))
+    return jsonify({
+        "ok": True,
+        "q": q,
+        "items": items,
+        # Cursor só na ordem cronológica; relevância é uma página só.
+        "next": _history_next(items, limit) if order == "recentes" else None,
+    })
+
+@app.route("/historico/exportar", methods=["GET"])
+def historico_exportar():
+    fmt = request.args.get("formato", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"ok": False, "error": "formato must be csv or ndjson"}), 400
+    try:
+        since, until = _date_arg("de"), _date_arg("ate", end=True)
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid date (use YYYY-MM-DD)"}), 400
+    compress = request.args.get("gzip") == "1"
+    filename = "historico." + fmt + (".gz" if compress else "")
+    chunks = export_history(
+        fmt, since, until,
+        after_id=request.args.get("desde_id", 0, type=int),
+        answers=request.args.get("respostas", "1") != "0",
+        compress=compress,
+    )
+    return Response(
+        stream_with_context(chunks),
+        mimetype="application/gzip" if compress else
+        ("text/csv" if fmt == "csv" else "application/x-ndjson"),
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+@app.route("/tendencias", methods=["GET"])
+def tendencias():
+    days = min(max(request.args.get("dias", 7, type=int), 1), TRENDING_MAX_DAYS)
+    limit = min(max(request.args.get("limite", 10, type=int), 1), TRENDING_MAX_LIMIT)
+    return jsonify({
+        "ok": True,
+        "dias": days,
+        "perguntas": trending("q", days, limit),
+        "tags": trending("tag", days, limit),
+    })
+
+@app.route("/metrics", methods=["GET"])
+def metrics_view():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/recursos")
+@http_cache(max_age=3600)
 def recursos():
     return render_template("resources.html", app_name=APP_NAME, links=LINKS_OFICIAIS)
 
 @app.route("/contrato", methods=["GET", "POST"])
+@http_cache(max_age=3600)
 def contrato():
     contrato_txt = None
+    nome = CONTRATO_MODELO_PADRAO
+    status = 200
     if request.method == "POST":
-        contrato_txt = gerar_contrato_advocacia(request.form)
-    return render_template("contrato.html", app_name=APP_NAME, contrato_txt=contrato_txt)
+        try:
+            nome = contrato_modelo(request.form.get("modelo"))
+            contrato_txt = gerar_contrato(request.form, nome)
+        except ValueError as e:
+            # Formulário HTML: o erro volta na própria página, não em JSON.
+            flash(str(e), "error")
+            status = 400
+    return render_template(
+        "contrato.html",
+        app_name=APP_NAME,
+        contrato_txt=contrato_txt,
+        modelos=CONTRATO_MODELOS,
+        modelo=nome,
+    ), status
+
+@app.route("/api/contrato", methods=["GET", "POST"])
+def api_contrato():
+    """Texto do contrato em JSON (prévia enquanto se digita) ou, com
+    formato=docx, o arquivo. Aceita JSON, formulário ou query string."""
+    data = request.get_json(silent=True) if request.is_json else request.values
+    try:
+        fields = _clean_contract_row(data)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    nome = contrato_modelo(fields.get("modelo"))
+    modelo = CONTRATO_MODELOS[nome]
+    texto = gerar_contrato(fields, nome)
+
+    formato = request.args.get("formato") or data.get("formato") or "json"
+    if formato == "docx":
+        return send_file(
+            _make_docx_bytes(title=modelo["titulo"], text=texto),
+            as_attachment=True,
+            download_name=f"{modelo['arquivo']}.docx",
+            mimetype=DOCX_MIMETYPE,
+        )
+    if formato != "json":
+        return jsonify({"ok": False, "error": "formato deve ser json ou docx"}), 400
+    return jsonify({"ok": True, "modelo": nome, "titulo": modelo["titulo"], "texto": texto})
+
+# =====================================================
+# ASSETS E SITE ESTÁTICO
+# =====================================================
+# asset_url() dá a URL de um arquivo de static/ com a impressão digital do
+# conteúdo: no app, /static/style.css?v=<hash>; no site estático,
+# /static/style.<hash>.css, que pode ficar em cache para sempre.
+#
+# `flask --app app static-build DIR` pré-renderiza o que não depende de quem
+# pergunta — a home (perguntas rápidas, sem histórico), /recursos e o JSON de
+# /qa de cada pergunta da base — com variantes .gz/.br e um manifest.json,
+# para nginx/CDN servirem direto. O Flask fica com histórico e contratos.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_COMPRESS_EXT = (".html", ".css", ".js", ".json", ".svg", ".txt")
+
+@lru_cache(maxsize=64)
+def _asset_hash(name: str) -> str:
+    with open(os.path.join(STATIC_DIR, name), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+@app.template_global()
+def asset_url(name: str) -> str:
+    built = g.get("static_assets")
+    if built is not None:
+        return "/" + built[name]
+    return url_for("static", filename=name, v=_asset_hash(name))
+
+@app.after_request
+def _asset_cache(resp):
+    # ?v= bate com o conteúdo: a URL muda quando o arquivo muda.
+    if request.endpoint == "static" and resp.status_code == 200:
+        name = (request.view_args or {}).get("filename") or ""
+        try:
+            versioned = request.args.get("v") == _asset_hash(name)
+        except OSError:
+            versioned = False
+        if versioned:
+            resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
+def _qa_static_path(q: str) -> str:
+    return f"qa/{hashlib.sha256(q.encode('utf-8')).hexdigest()[:16]}.json"
+
+def _static_pages(assets: Dict[str, str]) -> tuple:
+    """Páginas e respostas renderizadas como o app as serviria: (caminho ->
+    bytes, pergunta -> caminho do JSON da resposta)."""
+    questions = [r["question"] for r in db().execute("SELECT question FROM kb_entries ORDER BY position, id")]
+    pages, qa = {}, {}
+    with app.test_request_context("/qa"):
+        for q in questions:
+            qa[q] = _qa_static_path(q)
+            pages[qa[q]] = jsonify({"ok": True, "question": q, "answer_html": generate_answer_for_question(q)}).get_data()
+
+    quick = get_quick_questions()
+    with app.test_request_context("/"):
+        g.static_assets = assets
+        pages["index.html"] = render_template(
+            "home.html",
+            app_name=APP_NAME,
+            history=[],
+            history_before=None,
+            history_next=None,
+            answer=None,
+            questions=quick,
+            qa_static={q["text"]: "/" + qa[q["text"]] for q in quick if q["text"] in qa},
+        ).encode("utf-8")
+    with app.test_request_context("/recursos"):
+        g.static_assets = assets
+        pages["recursos/index.html"] = render_template(
+            "resources.html", app_name=APP_NAME, links=LINKS_OFICIAIS
+        ).encode("utf-8")
+    return pages, qa
+
+def build_static(out_dir: str) -> dict:
+    """Gera o site estático em out_dir (troca o anterior de uma vez) e
+    devolve o manifesto. Mesma entrada, mesmos bytes."""
+    try:
+        import brotli  # opcional: sem ele, só .gz
+    except ImportError:
+        brotli = None
+    out_dir = os.path.abspath(out_dir)
+    if os.path.isdir(out_dir) and os.listdir(out_dir) and not os.path.exists(os.path.join(out_dir, "manifest.json")):
+        raise ValueError(f"{out_dir} não está vazio e não é um build anterior")
+
+    files, assets = {}, {}
+    for name in sorted(os.listdir(STATIC_DIR)):
+        path = os.path.join(STATIC_DIR, name)
+        if os.path.isfile(path):
+            base, ext = os.path.splitext(name)
+            assets[name] = f"static/{base}.{_asset_hash(name)}{ext}"
+            with open(path, "rb") as f:
+                files[assets[name]] = f.read()
+    pages, qa = _static_pages(assets)
+    files.update(pages)
+
+    tmp = out_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    manifest = {
+        "build": BUILD_FINGERPRINT,
+        "kb_version": kb_version(),
+        "assets": assets,
+        "qa": qa,
+        "files": {},
+    }
+    for rel, data in sorted(files.items()):
+        path = os.path.join(tmp, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        entry = {
+            "bytes": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "type": mimetypes.guess_type(rel)[0] or "application/octet-stream",
+        }
+        if rel.endswith(STATIC_COMPRESS_EXT):
+            variants = {"gz": zlib.compress(data, 9, wbits=31)}
+            if brotli is not None:
+                variants["br"] = brotli.compress(data, quality=11)
+            for ext, packed in variants.items():
+                if len(packed) < len(data):
+                    with open(f"{path}.{ext}", "wb") as f:
+                        f.write(packed)
+                    entry[ext] = len(packed)
+        manifest["files"][rel] = entry
+    with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+    if os.path.isdir(out_dir):
+        old = out_dir + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(out_dir, old)
+        os.replace(tmp, out_dir)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, out_dir)
+    return manifest
+
+@app.cli.command("static-build")
+@click.argument("out_dir", type=click.Path(file_okay=False))
+def static_build_command(out_dir):
+    """Pré-renderiza home, /recursos e as respostas da base em OUT_DIR."""
+    try:
+        manifest = build_static(out_dir)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    files = manifest["files"].values()
+    click.echo(f"{len(manifest['files'])} arquivos ({len(manifest['qa'])} respostas), "
+               f"{sum(f['bytes'] for f in files)} bytes; "
+               f"{sum(1 for f in files if 'br' in f)} com .br, {sum(1 for f in files if 'gz' in f)} com .gz.")
 
 # =====================================================
 # LOCAL DEV
@@ -0,0 +1,260 @@
+# Modo assíncrono (opcional): entrada ASGI ao lado do app Flask.
+#
+#   uvicorn asgi:application --workers 1
+#
+# Um único processo atende milhares de conexões abertas: o event loop só faz
+# I/O de rede, e todo trabalho com SQLite (e o próprio Flask) roda num
+# ThreadPoolExecutor dedicado, de ASYNC_DB_THREADS threads. Cada thread tem a
+# sua conexão (app.db() é por thread), então nada de SQLite toca o loop.
+#
+# GET /qa e GET /historico são atendidos aqui direto (mesmo JSON, mesmo ETag e
+# mesmo cache de respostas do app); o resto — home, contrato, DOCX, exportação —
+# passa pela ponte WSGI abaixo, com as mesmas rotas e templates.
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as ethos
+
+ASYNC_DB_THREADS = int(os.environ.get("ASYNC_DB_THREADS", "8"))
+ASYNC_MAX_BODY_IN_MEMORY = 1024 * 1024
+
+_executor = {"pid": None, "pool": None}
+
+def db_executor() -> ThreadPoolExecutor:
+    """Executor do processo atual (recriado após fork)."""
+    if _executor["pid"] != os.getpid():
+        _executor.update(
+            pid=os.getpid(),
+            pool=ThreadPoolExecutor(ASYNC_DB_THREADS, thread_name_prefix="ethos-db"),
+        )
+    return _executor["pool"]
+
+async def run_db(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(db_executor(), fn, *args)
+
+# =====================================================
+# ROTAS NATIVAS
+# =====================================================
+def _query(scope) -> dict:
+    # Como request.args.get: vale o primeiro valor de cada chave.
+    qs = parse_qs(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+    return {k: v[0] for k, v in qs.items()}
+
+def _int_arg(args: dict, name: str, default=None):
+    try:
+        return int(args[name])
+    except (KeyError, ValueError):
+        return default
+
+def _header(scope, name: bytes) -> str:
+    for k, v in scope.get("headers", ()):
+        if k == name:
+            return v.decode("latin-1")
+    return ""
+
+def _has_session(scope) -> bool:
+    cookie_name = ethos.app.config["SESSION_COOKIE_NAME"]
+    for part in _header(scope, b"cookie").split(";"):
+        if part.split("=", 1)[0].strip() == cookie_name:
+            return True
+    return False
+
+def _etag_matches(scope, etag: str) -> bool:
+    for tag in _header(scope, b"if-none-match").split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/").strip('"') == etag:
+            return True
+    return False
+
+def _content_type(mimetype: str) -> str:
+    return f"{mimetype}; charset=utf-8" if mimetype.startswith("text/") else mimetype
+
+async def _respond(send, status: int, body: bytes = b"", mimetype: str = None, headers=()):
+    hdrs = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+    if mimetype:
+        hdrs.append((b"content-type", _content_type(mimetype).encode("latin-1")))
+    if status != 304:
+        hdrs.append((b"content-length", str(len(body)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": hdrs})
+    await send({"type": "http.response.body", "body": body})
+
+def _json_body(payload) -> bytes:
+    # Mesmos bytes do jsonify() do Flask.
+    return ethos.app.json.response(payload).get_data()
+
+def _qa_body(q: str) -> bytes:
+    html = ethos.generate_answer_for_question(q)
+    return _json_body({"ok": True, "question": q, "answer_html": html})
+
+async def qa_get(scope, send) -> int:
+    """GET /qa, equivalente a app.qa_get com @http_cache(300, ("q",), kb=True)."""
+    q = (_query(scope).get("q") or "").strip()
+    if not q:
+        await _respond(send, 400, _json_body({"ok": False, "error": "missing q"}), "application/json")
+        return 400
+    if not ethos.HTTP_CACHE or _has_session(scope):
+        await _respond(send, 200, await run_db(_qa_body, q), "application/json")
+        return 200
+
+    version = ethos.kb_version_cached()
+    if version is None:
+        version = await run_db(ethos.kb_version)
+    key = ethos.http_cache_key("/qa", [f"q={q}"], version or "")
+    etag = key[:32]
+    headers = [("ETag", f'"{etag}"'), ("Cache-Control", "public, max-age=300")]
+    if _etag_matches(scope, etag):
+        await _respond(send, 304, headers=headers)
+        return 304
+
+    cached = ethos._response_cache.get(key)
+    if cached is not None:
+        mimetype, body, vary = cached
+        if vary:
+            headers.append(("Vary", vary))
+    else:
+        mimetype, body = "application/json", await run_db(_qa_body, q)
+        ethos._response_cache.put(key, (mimetype, body, None), size=len(body))
+    await _respond(send, 200, body, mimetype, headers)
+    return 200
+
+def _historico_body(limit: int, before) -> bytes:
+    history = ethos.get_history(limit, before, include_pending=False)
+    return _json_body({
+        "ok": True,
+        "items": [{"id": h["id"], "question": h["question"], "created_at": h["created_at"]} for h in history],
+        "next": ethos._history_next(history, limit),
+    })
+
+async def historico(scope, send) -> int:
+    args = _query(scope)
+    limit = min(max(_int_arg(args, "limite", 50), 1), ethos.HISTORY_PAGE_MAX)
+    body = await run_db(_historico_body, limit, _int_arg(args, "antes"))
+    await _respond(send, 200, body, "application/json")
+    return 200
+
+NATIVE_ROUTES = {
+    "/qa": qa_get,
+    "/historico": historico,
+}
+
+# =====================================================
+# PONTE WSGI
+# =====================================================
+# A resposta inteira (inclusive geradores com stream_with_context) roda numa
+# thread do executor; cada pedaço é entregue ao loop e a thread espera o envio,
+# então um cliente lento segura a thread, não a memória. Diferente do
+# WsgiToAsgi do asgiref, que serializa as requisições numa thread só.
+def _environ(scope, body) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "REMOTE_ADDR": client[0],
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            key = name
+        else:
+            key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def _run_wsgi(environ, send, loop):
+    def push(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and len(started) == 3:
+            raise exc_info[1].with_traceback(exc_info[2])
+        started[:] = [int(status.split(" ", 1)[0]),
+                      [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]]
+
+    def start():
+        if len(started) == 2:
+            push({"type": "http.response.start", "status": started[0], "headers": started[1]})
+            started.append(True)
+
+    result = ethos.app(environ, start_response)
+    try:
+        for chunk in result:
+            if chunk:
+                start()
+                push({"type": "http.response.body", "body": chunk, "more_body": True})
+        start()
+        push({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+async def wsgi_bridge(scope, receive, send):
+    body = tempfile.SpooledTemporaryFile(ASYNC_MAX_BODY_IN_MEMORY)
+    more = True
+    while more:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            body.close()
+            return
+        body.write(message.get("body", b""))
+        more = message.get("more_body", False)
+    body.seek(0)
+    try:
+        await run_db(_run_wsgi, _environ(scope, body), send, asyncio.get_running_loop())
+    finally:
+        body.close()
+
+# =====================================================
+# APLICAÇÃO ASGI
+# =====================================================
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Schema/migrações e templates prontos antes da primeira requisição.
+            await run_db(ethos.ensure_db)
+            ethos.warm_up()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Linhas do write-behind ainda na fila são gravadas antes de sair.
+            await run_db(ethos.history_writer.close)
+            db_executor().shutdown(wait=True)
+            ethos.metrics.flush()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    view = NATIVE_ROUTES.get(scope["path"]) if scope["method"] == "GET" else None
+    if view is None:
+        # As rotas do Flask medem a própria latência (before/after_request).
+        return await wsgi_bridge(scope, receive, send)
+    t0 = time.perf_counter()
+    status = await view(scope, send)
+    labels = (("endpoint", view.__name__), ("method", "GET"), ("status", str(status)))
+    ethos.metrics.observe("http_request_duration_seconds", labels, time.perf_counter() - t0, ethos.LATENCY_BUCKETS)
+    # Gravar o snapshot é I/O de disco: fora do loop.
+    await run_db(ethos.metrics.maybe_flush)
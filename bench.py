@@ -0,0 +1,1175 @@
+"""Benchmarks do EthosJus.
+
+Uso:
+    python bench.py home-post --workers 4 --clients 8 --seconds 10
+    python bench.py home-post --env HISTORY_WRITE_BEHIND=1
+    python bench.py qa-index --entries 5000
+    python bench.py docx --repeat 3
+    python bench.py contrato --iterations 50
+    python bench.py contrato-lote --rows 10 500 5000
+    python bench.py static-build --iterations 50
+    python bench.py qa-lote --batch 500
+    python bench.py replay --batch 2000
+
+Histórico: disco e leitura antes/depois de deduplicar as respostas:
+    python bench.py history-storage --history-rows 200000
+    python bench.py history-pages --history-rows 10000000
+    python bench.py history-search --history-rows 2000000
+    python bench.py counters --history-rows 100000
+    python bench.py history-export --rows 10000 100000 1000000
+    python bench.py startup --repeat 5 --workers 4
+
+Modo assíncrono (asgi.py) contra gunicorn síncrono, mesma carga:
+    python bench.py async-load --workers 4 --rows 50 500 2000 --slow 8 --seconds 10
+
+Contenção no SQLite com vários workers (relatório JSON):
+    python bench.py contention --worker-counts 1 2 4 8 --write-ratio 0.3 --clients 16 \\
+        --history-rows 100000 --variant padrao: --variant write_behind:HISTORY_WRITE_BEHIND=1 \\
+        --save contencao.json
+
+Suíte com todas as rotas (linha de base + detecção de regressão):
+    python bench.py suite --save baseline.json
+    python bench.py suite --target gunicorn --workers 4 --clients 8 --compare baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+# =====================================================
+# HELPERS
+# =====================================================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def _server(argv, data_dir: str, extra_env=None):
+    """Sobe `python -m <argv> --bind/--port` e entrega (url base, processo)."""
+    port = _free_port()
+    env = dict(os.environ, ETHOSJUS_DATA_DIR=data_dir, **(extra_env or {}))
+    bind = ["--bind", f"127.0.0.1:{port}"] if argv[0] == "gunicorn" else ["--port", str(port)]
+    proc = subprocess.Popen([sys.executable, "-m", *argv, *bind, "--log-level", "warning"],
+                            cwd=ROOT, env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                urllib.request.urlopen(base + "/recursos", timeout=1).read()
+                break
+            except OSError:
+                if time.time() > deadline or proc.poll() is not None:
+                    raise RuntimeError(f"{argv[0]} não subiu")
+                time.sleep(0.05)
+        yield base, proc
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+@contextmanager
+def gunicorn_server(workers: int, data_dir: str, extra_env=None):
+    with _server(["gunicorn", "app:app", "--workers", str(workers)], data_dir, extra_env) as (base, _):
+        yield base
+
+
+def tree_rss_mb(pid: int) -> float:
+    """RSS somado do processo e dos filhos (workers), via /proc."""
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                total += next(int(l.split()[1]) for l in f if l.startswith("VmRSS:"))
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    stack.extend(int(c) for c in f.read().split())
+        except (OSError, StopIteration):
+            continue
+    return round(total / 1024, 1)
+
+
+def drive(url, data_fn, clients: int, seconds: float) -> dict:
+    """Dispara requisições de `clients` threads por `seconds` e mede vazão.
+
+    `url` é uma URL fixa (com `data_fn(n, i)` dando o corpo do POST) ou uma
+    função `(n, i) -> urllib.request.Request`.
+    """
+    lat, errors = [], [0]
+    lock = threading.Lock()
+    stop = time.time() + seconds
+
+    def worker(n):
+        i = 0
+        local, errs = [], 0
+        while time.time() < stop:
+            req = url(n, i) if callable(url) else urllib.request.Request(url, data=data_fn(n, i))
+            t0 = time.perf_counter()
+            try:
+                urllib.request.urlopen(req, timeout=30).read()
+                local.append(time.perf_counter() - t0)
+            except OSError:
+                errs += 1
+            i += 1
+        with lock:
+            lat.extend(local)
+            errors[0] += errs
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return summarize(lat, elapsed, errors[0])
+
+
+def summarize(lat, elapsed: float, errors: int = 0) -> dict:
+    lat = sorted(lat)
+
+    def pct(p):
+        return round(lat[min(len(lat) - 1, int(len(lat) * p))] * 1000, 3) if lat else None
+
+    return {
+        "requests": len(lat),
+        "errors": errors,
+        "rps": round(len(lat) / elapsed, 1) if elapsed else None,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+# =====================================================
+# CENÁRIOS
+# =====================================================
+def bench_home_post(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        with gunicorn_server(args.workers, tmp, args.env) as base:
+            def body(n, i):
+                return urllib.parse.urlencode(
+                    {"q": f"Posso impulsionar post no Instagram? ({n}-{i})"}
+                ).encode()
+            return drive(base + "/", body, args.clients, args.seconds)
+
+
+# Paráfrases das perguntas rápidas: (pergunta, pergunta da base esperada, ou
+# None quando o certo é cair na resposta geral).
+QA_PARAPHRASES = [
+    ("posso impulsionar posts no instagram", "Posso impulsionar post no Instagram?"),
+    ("Impulsionar publicação no Instagram é permitido?", "Posso impulsionar post no Instagram?"),
+    ("POSSO IMPULSIONAR POST NO INSTAGRAM", "Posso impulsionar post no Instagram?"),
+    ("pode divulgar preço e promoção", "Posso divulgar valores e promoções?"),
+    ("Posso prometer resultado?", "Posso prometer resultado ou usar 'garantia'?"),
+    ("posso postar foto com cliente", "Posso postar fotos com clientes ou processos?"),
+    ("posso me anunciar como especialista", "Posso anunciar 'especialista'?"),
+    ("responder caixinha de perguntas com um caso real", "Posso responder caixinha de perguntas com caso real?"),
+    ("Posso fazer sorteio?", "Posso fazer sorteio de brindes ou serviços?"),
+    ("posso usar o google ads", "Posso usar Google Ads (Links Patrocinados)?"),
+    ("Posso usar ads pagos do Google?", "Posso usar Google Ads (Links Patrocinados)?"),
+    ("posso mandar email marketing", "Posso enviar e-mail marketing ou mala direta?"),
+    ("posso colocar logotipo do tribunal no cartao de visita", "Posso usar logotipos de Tribunais no meu cartão?"),
+    ("posso falar do processo com a familia do cliente", "Posso falar do caso com familiares do cliente?"),
+    ("posso confirmar que alguem e meu cliente", "Posso confirmar que a pessoa é minha cliente?"),
+    ("como tratar documentos sensiveis lgpd", "Como lidar com documentos sensíveis e LGPD?"),
+    ("posso gravar a reuniao", "Posso gravar reunião com cliente?"),
+    ("devo ter contrato de honorarios escrito", "Preciso de contrato de honorários por escrito?"),
+    ("posso cobrar pela consulta", "Posso cobrar consulta? Como formalizar?"),
+    ("combinar honorarios de exito", "Como combinar êxito (quota litis) sem abusos?"),
+    ("cliente inadimplente sem expor, o que fazer", "O que fazer com inadimplência sem expor o cliente?"),
+    ("posso reter os documentos do cliente se ele nao pagar", "Posso reter documentos por falta de pagamento?"),
+    ("posso cobrar menos que a tabela da oab", "Posso cobrar abaixo da tabela da OAB?"),
+    ("aceitar bens como forma de pagamento", "Posso aceitar bens como pagamento?"),
+    ("qual a cor do céu", None),
+    ("posso comprar um carro", None),
+    ("como faço para tirar a carteira da OAB?", None),
+    ("Posso atuar contra ex-cliente?", None),
+    ("advogado pode ser preposto", None),
+]
+
+
+def _import_app(data_dir: str, **env):
+    os.environ["ETHOSJUS_DATA_DIR"] = data_dir
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+def bench_qa_index(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp)
+        with app.app.app_context():
+            ok, misses = 0, []
+            for q, expected in QA_PARAPHRASES:
+                hit = app.kb_best_match(q)
+                got = hit[0]["question"] if hit and hit[0]["title"] else None
+                if got == expected:
+                    ok += 1
+                else:
+                    misses.append({"q": q, "esperado": expected, "obtido": got})
+
+            # Base sintética com `--entries` perguntas para medir a latência.
+            # Metade das palavras vem das respostas reais e metade de um
+            # vocabulário que cresce com a base (como em texto real), para a
+            # busca não ficar artificialmente densa.
+            data = app.kb_export(app.db())
+            text = json.dumps(data, ensure_ascii=False)
+            words = sorted(set(re.findall(r"[^\W\d_]{4,}", text)))
+            rng = random.Random(42)
+            syl = ["ba", "ce", "di", "fo", "gu", "la", "me", "ni", "po", "ra", "se", "ti", "vu"]
+            extra = ["".join(rng.choice(syl) for _ in range(4)) for _ in range(args.entries)]
+            while len(data["entries"]) < args.entries:
+                data["entries"].append({
+                    "question": " ".join(rng.sample(words, 3) + rng.sample(extra, 3)) + "?",
+                    "title": "Sintética", "bullets": rng.sample(words, 8),
+                })
+            t0 = time.perf_counter()
+            app.kb_import(app.db(), data)
+            build_s = time.perf_counter() - t0
+            app.kb_version()
+            queries = [q for q, _ in QA_PARAPHRASES]
+            lat = []
+            for _ in range(max(1, 2000 // len(queries))):
+                for q in queries:
+                    t0 = time.perf_counter()
+                    app.kb_best_match(q)
+                    lat.append(time.perf_counter() - t0)
+        return {
+            "acertos": f"{ok}/{len(QA_PARAPHRASES)}",
+            "erros": misses,
+            "entradas": len(data["entries"]),
+            "import_ms": round(build_s * 1000, 1),
+            "lookup": summarize(lat, sum(lat)),
+        }
+
+
+def long_contract_fields(i: int = 0) -> dict:
+    """Campos longos para gerar_contrato_advocacia() (contrato de várias páginas)."""
+    clause = ("O(a) CONTRATADO(A) acompanhará o processo em todas as instâncias "
+              "ordinárias, com relatórios mensais ao(à) CONTRATANTE. ")
+    return {
+        "contratante": f"Empresa Exemplo {i} Ltda., CNPJ 00.000.000/0001-{i % 100:02d}",
+        "contratado": "Fulana de Tal Sociedade Individual de Advocacia",
+        "oab": "OAB/SP 123456",
+        "foro": "Comarca de São Paulo/SP",
+        "objeto": "a defesa em ação de cobrança. " + clause * 20,
+        "honorarios": "R$ 15.000,00 fixos e 20% de êxito. " + clause * 10,
+        "despesas": "Por conta do(a) CONTRATANTE. " + clause * 10,
+        "comunicacao": "E-mail e WhatsApp",
+        "rescisao": "Aviso prévio de 30 dias. " + clause * 20,
+    }
+
+
+def _timeit(fn, n: int) -> dict:
+    lat = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        lat.append(time.perf_counter() - t0)
+    return summarize(lat, sum(lat))
+
+
+def bench_docx(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp)
+        title = "Contrato de Prestação de Serviços Advocatícios"
+        text = app.gerar_contrato_advocacia(long_contract_fields())
+        # Contrato longo: o texto base repetido em anexos.
+        text = "\n\n".join([text] * args.repeat)
+        n = args.iterations
+        app._build_docx_ooxml(title, text)  # aquece o modelo pré-montado
+        out = {
+            "linhas": text.count("\n") + 1,
+            "bytes_python_docx": len(app._build_docx_python_docx(title, text)),
+            "bytes_ooxml": len(app._build_docx_ooxml(title, text)),
+            "python_docx": _timeit(lambda: app._build_docx_python_docx(title, text), n),
+            "ooxml": _timeit(lambda: app._build_docx_ooxml(title, text), n),
+        }
+        app._make_docx_bytes(title, text)
+        out["cache_hit"] = _timeit(lambda: app._make_docx_bytes(title, text), n)
+        client = app.app.test_client()
+        form = {"doc_title": title, "doc_text": text, "doc_filename": "contrato"}
+        out["rota_download_docx"] = _timeit(lambda: client.post("/download-docx", data=form).data, n)
+        return out
+
+
+def bench_contrato(args) -> dict:
+    """Geração do texto (cache de entradas repetidas x entradas novas) e prévia
+    enquanto se digita: página /contrato inteira x JSON de /api/contrato."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp)
+        n = args.iterations * 20
+        short = {"contratante": "Ana Souza", "contratado": "Bia Lima", "objeto": "defesa em ação de cobrança."}
+        longo = long_contract_fields()
+        out = {}
+        for modelo in app.CONTRATO_MODELOS:
+            app.gerar_contrato(short, modelo)
+            out[f"{modelo}_repetido"] = _timeit(lambda: app.gerar_contrato(short, modelo), n)
+            seq = iter(range(n))
+            out[f"{modelo}_novo"] = _timeit(
+                lambda: app.gerar_contrato(dict(short, contratante=f"Cliente {next(seq)}"), modelo), n)
+        out["longo_sem_cache"] = _timeit(lambda: app.gerar_contrato(longo), n)
+
+        # Prévia: cada tecla no campo "objeto" vira uma requisição.
+        client = app.app.test_client()
+        typed = [dict(short, objeto=longo["objeto"][:i]) for i in range(1, 400)]
+        for name, path in (("rota_contrato_pagina", "/contrato"), ("rota_api_contrato", "/api/contrato")):
+            keys = iter(typed * (n // len(typed) + 1))
+            out[name] = _timeit(lambda: client.post(path, data=next(keys)).data, n // 10)
+        return out
+
+
+def bench_static_build(args) -> dict:
+    """Build do site estático: tempo, bytes servidos (cru/gzip/brotli) e a
+    latência no Flask das mesmas respostas, que deixam de passar por ele."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp)
+        out = os.path.join(tmp, "site")
+        t0 = time.perf_counter()
+        manifest = app.build_static(out)
+        result = {"build_ms": round((time.perf_counter() - t0) * 1000, 1), "arquivos": len(manifest["files"])}
+        for kind in ("bytes", "gz", "br"):
+            result[f"total_{kind}"] = sum(f.get(kind, f["bytes"]) for f in manifest["files"].values())
+        client = app.app.test_client()
+        qs = list(manifest["qa"])
+        n = args.iterations * 10
+        seq = iter(range(n))
+        result["flask_qa"] = _timeit(lambda: client.get("/qa", query_string={"q": qs[next(seq) % len(qs)]}).data, n)
+        result["flask_home"] = _timeit(lambda: client.get("/").data, n)
+        result["flask_recursos"] = _timeit(lambda: client.get("/recursos").data, n)
+        return result
+
+
+def bench_contrato_lote(args) -> dict:
+    """Lote em CSV pela rota /contrato/lote; mede pico de memória (tracemalloc)
+    no processo da aplicação enquanto o ZIP é consumido em streaming."""
+    import csv
+    import io
+    import tracemalloc
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp)
+        app.BATCH_MAX_BYTES = 1 << 30  # campos longos: 5.000 linhas passam de 20 MB
+        client = app.app.test_client()
+        out = {}
+        for rows in args.rows:
+            buf = io.StringIO()
+            w = csv.DictWriter(buf, fieldnames=app.CONTRATO_FIELDS)
+            w.writeheader()
+            for i in range(rows):
+                w.writerow(long_contract_fields(i))
+            payload = buf.getvalue().encode("utf-8")
+            del buf
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            resp = client.post(
+                "/contrato/lote", buffered=False, content_type="multipart/form-data",
+                data={"arquivo": (io.BytesIO(payload), "lote.csv")},
+            )
+            if resp.status_code != 200:
+                raise RuntimeError(f"/contrato/lote respondeu {resp.status_code}")
+            size = sum(len(chunk) for chunk in resp.response)
+            resp.close()
+            elapsed = time.perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            out[str(rows)] = {
+                "zip_bytes": size,
+                "segundos": round(elapsed, 2),
+                "contratos_por_s": round(rows / elapsed, 1),
+                "pico_memoria_kb": round(peak / 1024),
+            }
+        return out
+
+
+def bench_qa_lote(args) -> dict:
+    """N perguntas em N chamadas GET /qa x uma chamada POST /qa/lote."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp)
+        client = app.app.test_client()
+        questions = [f"{q} ({i})" for i in range(args.batch // len(QA_PARAPHRASES) + 1)
+                     for q, _ in QA_PARAPHRASES][:args.batch]
+        t0 = time.perf_counter()
+        for q in questions:
+            client.get("/qa", query_string={"q": q}).get_json()
+        single_s = time.perf_counter() - t0
+        app._answer_for.cache_clear()
+
+        t0 = time.perf_counter()
+        client.post("/qa/lote", json={"questions": questions, "record": True}).get_json()
+        batch_s = time.perf_counter() - t0
+        app._answer_for.cache_clear()
+
+        t0 = time.perf_counter()
+        resp = client.post("/qa/lote", json={"questions": questions, "stream": True}, buffered=False)
+        chunks = iter(resp.response)
+        next(chunks)
+        first_s = time.perf_counter() - t0
+        lines = 1 + sum(1 for _ in chunks)
+        resp.close()
+        stream_s = time.perf_counter() - t0
+        return {
+            "perguntas": len(questions),
+            "qa_individual_ms": round(single_s * 1000, 1),
+            "qa_lote_ms": round(batch_s * 1000, 1),
+            "ndjson_primeira_linha_ms": round(first_s * 1000, 2),
+            "ndjson_total_ms": round(stream_s * 1000, 1),
+            "ndjson_linhas": lines,
+        }
+
+
+def bench_history_storage(args) -> dict:
+    """Tamanho em disco e latência de leitura do histórico com a resposta
+    inline em cada linha (layout antigo) e depois da migração para qa_answers."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp, HISTORY_COMPACT_INTERVAL_S="0")
+        questions = [q["text"] for q in app.get_quick_questions()]
+        answers = [app.generate_answer_for_question(q) for q in questions]
+        conn = app.db()
+        n = args.history_rows
+        with conn:
+            for start in range(0, n, 50_000):
+                conn.executemany(
+                    "INSERT INTO qa_history (question, answer, created_at) VALUES (?,?,?)",
+                    ((questions[i % len(questions)], answers[i % len(questions)], "01/01 12:00")
+                     for i in range(start, min(n, start + 50_000)))
+                )
+
+        def measure() -> dict:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return {
+                "bytes": os.path.getsize(app.DB_PATH),
+                "get_history_50": _timeit(lambda: app.get_history(50), args.iterations),
+                "get_history_1000": _timeit(lambda: app.get_history(1000), max(10, args.iterations // 10)),
+            }
+
+        antes = measure()
+        t0 = time.perf_counter()
+        total = app.compact_history(conn)
+        migracao_s = time.perf_counter() - t0
+        depois = measure()
+        return {
+            "linhas": n,
+            "respostas_distintas": conn.execute("SELECT COUNT(*) FROM qa_answers").fetchone()[0],
+            "migracao": {**total, "segundos": round(migracao_s, 2)},
+            "antes": antes,
+            "depois": depois,
+            "reducao_disco": round(1 - depois["bytes"] / antes["bytes"], 3),
+        }
+
+
+def bench_history_pages(args) -> dict:
+    """Latência da home e de páginas do histórico (início e meio da tabela)
+    com 1K linhas e depois de crescer até --history-rows linhas."""
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp, HISTORY_COMPACT_INTERVAL_S="0")
+        client = app.app.test_client()
+        seeded = 0
+        for rows in (1000, args.history_rows):
+            seed_history(app, rows - seeded)
+            seeded = rows
+            middle = rows // 2
+            out[str(rows)] = {
+                "home_get": _timeit(lambda: client.get("/").get_data(), args.iterations),
+                "historico_inicio": _timeit(lambda: client.get("/historico").get_data(), args.iterations),
+                "historico_meio": _timeit(
+                    lambda: client.get("/historico", query_string={"antes": middle}).get_data(), args.iterations),
+            }
+    return out
+
+
+def seed_out_of_order(app) -> list:
+    """Três linhas com created_at fora da ordem dos ids (como no write-behind,
+    que carimba a hora na fila) e uma com data legada ("dd/mm", que na ordem
+    de texto cai depois de 2099); devolve os ids que caem em de=2099-01-01."""
+    conn = app.db()
+    with conn:
+        ids = app._insert_history(conn, [
+            ("honorarios fora de ordem", "", "2099-01-01T00:00:01"),
+            ("honorarios fora de ordem", "", "2099-01-01T00:00:00"),
+            ("honorarios fora de ordem", "", "2098-12-31T23:59:59"),
+            ("honorarios fora de ordem", "", "28/12 10:00"),
+        ])
+    return sorted(ids[:2])
+
+
+def bench_history_search(args) -> dict:
+    """Latência de /historico/busca com --history-rows linhas no histórico."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp, HISTORY_COMPACT_INTERVAL_S="0")
+        t0 = time.perf_counter()
+        seed_history(app, args.history_rows)
+        seed_s = time.perf_counter() - t0
+        client = app.app.test_client()
+        expected = seed_out_of_order(app)
+        found = client.get("/historico/busca", query_string={"q": "honorarios", "de": "2099-01-01"}).get_json()
+        assert sorted(h["id"] for h in found["items"]) == expected, found
+        today = time.strftime("%Y-%m-%d")
+        cases = {
+            "comum_recentes": {"q": "honorarios"},
+            "comum_relevancia": {"q": "honorarios", "ordem": "relevancia"},
+            "duas_palavras": {"q": "sigilo cliente", "ordem": "relevancia"},
+            "rara": {"q": "inexistentezzz"},
+            "com_periodo": {"q": "honorarios", "de": today, "ate": today},
+        }
+        out = {"linhas": args.history_rows, "seed_s": round(seed_s, 1)}
+        for name, params in cases.items():
+            hits = len(client.get("/historico/busca", query_string=params).get_json()["items"])
+            out[name] = {"itens": hits, **_timeit(
+                lambda: client.get("/historico/busca", query_string=params).get_data(), args.iterations)}
+        return out
+
+
+def bench_counters(args) -> dict:
+    """Custo dos contadores: gravação de uma pergunta (com e sem a
+    atualização dos contadores), recálculo do top-N e /tendencias."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp, HISTORY_COMPACT_INTERVAL_S="0")
+        seed_history(app, args.history_rows)
+        questions = [q["text"] for q in app.get_quick_questions()]
+        answer = app.generate_answer_for_question(questions[0])
+        client = app.app.test_client()
+        com = _timeit(lambda: app.save_history(questions[1], answer), args.iterations)
+        bump = app.bump_counters
+        app.bump_counters = lambda conn, items: None
+        sem = _timeit(lambda: app.save_history(questions[1], answer), args.iterations)
+        app.bump_counters = bump
+        return {
+            "linhas": args.history_rows,
+            "save_history_com_contadores": com,
+            "save_history_sem_contadores": sem,
+            "top_30_dias_sem_cache": _timeit(
+                lambda: app._window_counts("q", 30, app.datetime.now(), keys=questions), args.iterations),
+            "home_get": _timeit(lambda: client.get("/").get_data(), args.iterations),
+            "tendencias": _timeit(lambda: client.get("/tendencias").get_data(), args.iterations),
+        }
+
+
+def bench_history_export(args) -> dict:
+    """Vazão e pico de memória (tracemalloc) de /historico/exportar com o
+    histórico crescendo: o pico deve ficar igual para qualquer tamanho."""
+    import tracemalloc
+
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp, HISTORY_COMPACT_INTERVAL_S="0")
+        client = app.app.test_client()
+        expected = seed_out_of_order(app)
+        for fmt in ("ndjson", "csv"):
+            lines = client.get("/historico/exportar", query_string={"formato": fmt, "de": "2099-01-01"}
+                               ).get_data(as_text=True).splitlines()
+            ids = [json.loads(l)["id"] for l in lines] if fmt == "ndjson" else \
+                  [int(l.split(",", 1)[0]) for l in lines[1:]]
+            assert sorted(ids) == expected, (fmt, lines)
+        seeded = 4
+        for rows in sorted(set(args.rows)):
+            seed_history(app, rows - seeded)
+            seeded = rows
+            for fmt, gz in (("csv", "0"), ("ndjson", "0"), ("csv", "1")):
+                def export():
+                    resp = client.get("/historico/exportar", query_string={"formato": fmt, "gzip": gz},
+                                      buffered=False)
+                    size = sum(len(piece) for piece in resp.response)
+                    resp.close()
+                    return size
+
+                t0 = time.perf_counter()
+                size = export()
+                elapsed = time.perf_counter() - t0
+                # Segunda passada só para o pico: tracemalloc deixa tudo mais lento.
+                tracemalloc.start()
+                export()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                out[f"{rows}_{fmt}{'_gzip' if gz == '1' else ''}"] = {
+                    "bytes": size,
+                    "linhas_por_s": round(rows / elapsed),
+                    "pico_memoria_kb": round(peak / 1024),
+                }
+    return out
+
+
+STARTUP_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+out = {"import_ms": (time.perf_counter() - t0) * 1000}
+if "--preload" in sys.argv:
+    # O que o master do gunicorn faz antes do fork (gunicorn.conf.py).
+    t0 = time.perf_counter()
+    app.ensure_db()
+    app.warm_up()
+    out["preload_ms"] = (time.perf_counter() - t0) * 1000
+client = app.app.test_client()
+calls = [
+    ("home", lambda: client.get("/")),
+    ("qa", lambda: client.get("/qa", query_string={"q": "Posso cobrar honorários de êxito?"})),
+    ("download_docx", lambda: client.post("/download-docx", data={"doc_title": "T", "doc_text": "texto"})),
+]
+for name, call in calls:
+    t = time.perf_counter()
+    call()
+    out[name + "_primeira_ms"] = (time.perf_counter() - t) * 1000
+out["modulos"] = len(sys.modules)
+print(json.dumps(out))
+"""
+
+
+def bench_startup(args) -> dict:
+    """Processo novo: tempo de import do app e da primeira requisição de cada
+    tipo; e tempo do gunicorn (--workers) até responder."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, ETHOSJUS_DATA_DIR=tmp)
+
+        def probe(*flags) -> dict:
+            res = subprocess.run([sys.executable, "-c", STARTUP_PROBE, *flags], cwd=ROOT, env=env,
+                                 capture_output=True, text=True, check=True)
+            return json.loads(res.stdout)
+
+        def median(runs):
+            return {k: round(statistics.median(r[k] for r in runs), 1) for k in runs[0]}
+
+        result = {"banco_novo": {k: round(v, 1) for k, v in probe().items()}}
+        result["mediana"] = median([probe() for _ in range(args.repeat)])
+        result["mediana_preload"] = median([probe("--preload") for _ in range(args.repeat)])
+        boots = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            with gunicorn_server(args.workers, tmp):
+                boots.append((time.perf_counter() - t0) * 1000)
+        result["gunicorn_pronto_ms"] = round(statistics.median(boots), 1)
+        return result
+
+
+def _load_paths(n: int = 400) -> list:
+    """Mistura de leitura: metade perguntas da base (cache), um quarto
+    perguntas novas (geram resposta) e um quarto páginas do histórico."""
+    with open(os.path.join(ROOT, "knowledge_base.json"), encoding="utf-8") as f:
+        kb = [e["question"] for e in json.load(f)["entries"]]
+    paths = []
+    for i in range(n):
+        if i % 4 == 3:
+            paths.append("/historico?limite=20")
+        elif i % 4 == 2:
+            paths.append("/qa?" + urllib.parse.urlencode({"q": f"pergunta nova {i} sobre honorários"}))
+        else:
+            paths.append("/qa?" + urllib.parse.urlencode({"q": kb[i % len(kb)]}))
+    return paths
+
+
+async def _aload(base: str, paths: list, clients: int, slow: int, seconds: float) -> dict:
+    """`clients` conexões simultâneas em laço (uma requisição por conexão) e
+    `slow` conexões lentas, que mandam um cabeçalho por segundo e seguram o
+    socket aberto o teste todo."""
+    import asyncio
+
+    url = urllib.parse.urlsplit(base)
+    host, port = url.hostname, url.port
+    loop = asyncio.get_running_loop()
+    stop = loop.time() + seconds
+    lat, errors = [], [0]
+
+    async def client(n):
+        i = n
+        while loop.time() < stop:
+            path, i = paths[i % len(paths)], i + clients
+            t0 = time.perf_counter()
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 30)
+                writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n".encode())
+                data = await asyncio.wait_for(reader.read(), 30)
+                writer.close()
+                if data[9:12] != b"200":
+                    raise OSError(data[:12])
+                lat.append(time.perf_counter() - t0)
+            except (OSError, asyncio.TimeoutError):
+                errors[0] += 1
+
+    async def hold(n):
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b"GET /qa?q=lenta HTTP/1.1\r\nHost: bench\r\n")
+            while loop.time() < stop:
+                await asyncio.sleep(1)
+                writer.write(f"X-Lenta-{n}: 1\r\n".encode())
+                await writer.drain()
+            writer.close()
+        except OSError:
+            pass
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(n) for n in range(clients)], *[hold(n) for n in range(slow)])
+    return summarize(lat, time.perf_counter() - t0, errors[0])
+
+
+def bench_async_load(args) -> dict:
+    """gunicorn síncrono (--workers) contra o modo ASGI (uvicorn, 1 processo):
+    vazão, latência e RSS total do servidor para cada nível de conexões
+    simultâneas (--rows), com e sem --slow conexões lentas."""
+    import asyncio
+
+    servers = {
+        f"gunicorn_{args.workers}w": ["gunicorn", "app:app", "--workers", str(args.workers)],
+        "uvicorn_asgi": ["uvicorn", "asgi:application", "--workers", "1", "--backlog", "4096"],
+    }
+    paths = _load_paths()
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, argv in servers.items():
+            res = result[name] = {}
+            with _server(argv, tmp, args.env) as (base, proc):
+                asyncio.run(_aload(base, paths, 4, 0, 1.0))  # aquece caches
+                res["rss_ocioso_mb"] = tree_rss_mb(proc.pid)
+                for slow in sorted({0, args.slow}):
+                    for clients in args.rows:
+                        peak = [0.0]
+                        done = threading.Event()
+
+                        def sample():
+                            while not done.wait(0.2):
+                                peak[0] = max(peak[0], tree_rss_mb(proc.pid))
+
+                        sampler = threading.Thread(target=sample)
+                        sampler.start()
+                        run = asyncio.run(_aload(base, paths, clients, slow, args.seconds))
+                        done.set()
+                        sampler.join()
+                        run["rss_pico_mb"] = peak[0]
+                        res[f"{clients}_conexoes" + (f"_{slow}_lentas" if slow else "")] = run
+    return result
+
+
+def _worker_snapshots(data_dir: str, skip_pid: int) -> dict:
+    """Snapshots de métricas gravados por cada worker (o do master fica de fora)."""
+    snaps = {}
+    mdir = os.path.join(data_dir, "metrics")
+    for name in os.listdir(mdir) if os.path.isdir(mdir) else []:
+        if name.endswith(".json") and name != f"{skip_pid}.json":
+            with open(os.path.join(mdir, name), encoding="utf-8") as f:
+                snaps[name[:-5]] = json.load(f)
+    return snaps
+
+
+def _hist_quantile(bounds, counts, count: int, q: float):
+    """Limite superior (ms) da faixa onde cai o quantil q; None = acima da última."""
+    acc = 0
+    for le, c in zip(bounds, counts):
+        acc += c
+        if acc >= q * count:
+            return round(le * 1000, 3)
+    return None
+
+
+def _sql_writes(snaps: dict) -> dict:
+    """Comandos de escrita (INSERT/UPDATE/DELETE e COMMIT), somados por
+    comando. O tempo inclui a espera pelo lock de escrita (busy_timeout)."""
+    by_stmt, errors = {}, {}
+    for snap in snaps.values():
+        bounds = snap["buckets"].get("sql_statement_duration_seconds", [])
+        for name, labels, counts, total, count in snap["histograms"]:
+            stmt = dict(labels).get("statement", "")
+            if name != "sql_statement_duration_seconds" or not stmt.startswith(("INSERT", "UPDATE", "DELETE", "COMMIT")):
+                continue
+            h = by_stmt.setdefault(stmt, [[0] * len(counts), 0.0, 0, bounds])
+            h[0] = [x + y for x, y in zip(h[0], counts)]
+            h[1] += total
+            h[2] += count
+        for name, labels, value in snap["counters"]:
+            if name == "sql_lock_errors_total":
+                stmt = dict(labels).get("statement", "")
+                errors[stmt] = errors.get(stmt, 0) + value
+    out = {}
+    for stmt, (counts, total, count, bounds) in sorted(by_stmt.items(), key=lambda kv: -kv[1][1]):
+        out[stmt[:60]] = {
+            "n": count,
+            "total_s": round(total, 3),
+            "media_ms": round(total / count * 1000, 3),
+            "p50_ms": _hist_quantile(bounds, counts, count, 0.50),
+            "p99_ms": _hist_quantile(bounds, counts, count, 0.99),
+        }
+    return {
+        "comandos": out,
+        "escrita_total_s": round(sum(c[1] for c in by_stmt.values()), 3),
+        "erros_lock": int(sum(errors.values())),
+    }
+
+
+def _drive_mix(base: str, write_ratio: float, clients: int, seconds: float) -> dict:
+    """Como drive(), com mistura de leitura/escrita e latência por tipo:
+    escrita = POST / (save_history); leitura = GET / e GET /historico."""
+    with open(os.path.join(ROOT, "knowledge_base.json"), encoding="utf-8") as f:
+        kb = [e["question"] for e in json.load(f)["entries"]]
+    lat = {"escrita": [], "leitura_home": [], "leitura_historico": []}
+    errors = {k: 0 for k in lat}
+    status = {}
+    lock = threading.Lock()
+    stop = time.time() + seconds
+
+    def worker(n):
+        rnd = random.Random(n)
+        local = {k: [] for k in lat}
+        errs, codes = {k: 0 for k in lat}, {}
+        i = 0
+        while time.time() < stop:
+            if rnd.random() < write_ratio:
+                kind = "escrita"
+                # Metade perguntas da base (resposta já deduplicada), metade novas.
+                q = kb[i % len(kb)] if i % 2 else f"{kb[i % len(kb)]} ({n}-{i})"
+                req = urllib.request.Request(base + "/", data=urllib.parse.urlencode({"q": q}).encode())
+            elif rnd.random() < 0.5:
+                kind, req = "leitura_home", urllib.request.Request(base + "/")
+            else:
+                kind, req = "leitura_historico", urllib.request.Request(base + "/historico?limite=50")
+            t0 = time.perf_counter()
+            try:
+                urllib.request.urlopen(req, timeout=60).read()
+                local[kind].append(time.perf_counter() - t0)
+            except urllib.error.HTTPError as e:
+                errs[kind] += 1
+                codes[e.code] = codes.get(e.code, 0) + 1
+            except OSError:
+                errs[kind] += 1
+                codes["conexao"] = codes.get("conexao", 0) + 1
+            i += 1
+        with lock:
+            for k in lat:
+                lat[k].extend(local[k])
+                errors[k] += errs[k]
+            for c, v in codes.items():
+                status[str(c)] = status.get(str(c), 0) + v
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    out = {k: summarize(v, elapsed, errors[k]) for k, v in lat.items()}
+    out["total"] = summarize([x for v in lat.values() for x in v], elapsed, sum(errors.values()))
+    out["erros_por_status"] = status
+    return out
+
+
+def _variants(specs) -> list:
+    """--variant nome:CHAVE=VALOR,CHAVE=VALOR (repetível); sem nenhuma, "padrao"."""
+    out = []
+    for spec in specs or ["padrao:"]:
+        name, _, kvs = spec.partition(":")
+        out.append((name, dict(kv.split("=", 1) for kv in kvs.split(",") if kv)))
+    return out
+
+
+def bench_contention(args) -> dict:
+    """Contenção no SQLite compartilhado: para cada variante de configuração
+    (--variant) e cada nº de workers do gunicorn (--worker-counts), mistura
+    de leitura/escrita (--write-ratio) com --clients clientes. Relata latência
+    por tipo, erros, tempo dos comandos de escrita (inclui espera por lock),
+    erros de lock e requisições por worker. --save grava o relatório."""
+    import shutil
+
+    report = {
+        "config": {
+            "worker_counts": args.worker_counts, "write_ratio": args.write_ratio,
+            "clients": args.clients, "seconds": args.seconds,
+            "history_rows": args.history_rows, "env": args.env, "cpus": os.cpu_count(),
+        },
+        "resultados": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_dir = os.path.join(tmp, "seed")
+        app = _import_app(seed_dir)
+        seed_history(app, args.history_rows)
+        app.db().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        for name, env in _variants(args.variant):
+            res = report["resultados"][name] = {"env": env}
+            for workers in args.worker_counts:
+                run_dir = os.path.join(tmp, f"{name}-{workers}")
+                shutil.copytree(seed_dir, run_dir, ignore=shutil.ignore_patterns("metrics"))
+                argv = ["gunicorn", "app:app", "--workers", str(workers), "--timeout", "120"]
+                with _server(argv, run_dir, dict(args.env, **env)) as (base, proc):
+                    run = _drive_mix(base, args.write_ratio, args.clients, args.seconds)
+                    master = proc.pid
+                # Workers saem pelo SIGTERM e gravam o snapshot final (atexit).
+                snaps = _worker_snapshots(run_dir, master)
+                run["sql_escrita"] = _sql_writes(snaps)
+                run["por_worker"] = sorted(
+                    sum(h[4] for h in s["histograms"] if h[0] == "http_request_duration_seconds")
+                    for s in snaps.values()
+                )
+                res[f"{workers}_workers"] = run
+                shutil.rmtree(run_dir)
+
+    # Maior vazão sem erro, por variante.
+    for name, res in report["resultados"].items():
+        ok = [(r["total"]["rps"], k) for k, r in res.items() if k != "env" and r["total"]["errors"] == 0]
+        res["melhor"] = max(ok)[1] if ok else None
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+    return report
+
+
+def bench_replay(args) -> dict:
+    """Replay de GET /qa com as perguntas gravadas em qa_history: sem cache
+    HTTP, com o cache de respostas renderizadas e com revalidação (304)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp)
+        rng = random.Random(7)
+        base = [q for q, _ in QA_PARAPHRASES]
+        app.save_history_many([(rng.choice(base), "") for _ in range(args.batch)])
+        questions = [r["question"] for r in app.get_history(args.batch)]
+        client = app.app.test_client()
+
+        def run(headers_for=None):
+            lat = []
+            cpu0 = time.process_time()
+            t0 = time.perf_counter()
+            for q in questions:
+                t = time.perf_counter()
+                client.get("/qa", query_string={"q": q}, headers=headers_for(q) if headers_for else None)
+                lat.append(time.perf_counter() - t)
+            res = summarize(lat, time.perf_counter() - t0)
+            res["cpu_us_por_req"] = round((time.process_time() - cpu0) / len(questions) * 1e6, 1)
+            return res
+
+        app.HTTP_CACHE = False
+        run()  # aquece o memo de respostas, comum aos três modos
+        sem_cache = run()
+        app.HTTP_CACHE = True
+        run()  # aquece
+        com_cache = run()
+        etags = {q: client.get("/qa", query_string={"q": q}).headers["ETag"] for q in set(questions)}
+        revalidacao = run(lambda q: {"If-None-Match": etags[q]})
+        out = {"perguntas": len(questions), "qa": {
+            "sem_cache": sem_cache, "cache_renderizado": com_cache, "if_none_match_304": revalidacao,
+        }}
+        for path in ("/recursos", "/contrato"):
+            res = {}
+            for label, enabled, headers in (("sem_cache", False, None),
+                                            ("cache_renderizado", True, None),
+                                            ("if_none_match_304", True, "etag")):
+                app.HTTP_CACHE = enabled
+                h = {"If-None-Match": client.get(path).headers["ETag"]} if headers else None
+                cpu0 = time.process_time()
+                lat = []
+                for _ in range(args.iterations * 10):
+                    t = time.perf_counter()
+                    client.get(path, headers=h)
+                    lat.append(time.perf_counter() - t)
+                res[label] = summarize(lat, sum(lat))
+                res[label]["cpu_us_por_req"] = round((time.process_time() - cpu0) / len(lat) * 1e6, 1)
+            out[path] = res
+        return out
+
+
+# =====================================================
+# SUÍTE COMPLETA (TODAS AS ROTAS)
+# =====================================================
+def seed_history(app, rows: int, chunk: int = 50_000):
+    """Pré-carrega `rows` perguntas rápidas no histórico, pela API do app."""
+    questions = [q["text"] for q in app.get_quick_questions()]
+    answers = {q: app.generate_answer_for_question(q) for q in questions}
+    done = 0
+    while done < rows:
+        n = min(chunk, rows - done)
+        app.save_history_many([(questions[(done + i) % len(questions)],
+                                answers[questions[(done + i) % len(questions)]]) for i in range(n)])
+        done += n
+
+
+def suite_routes(app) -> dict:
+    """nome -> i -> (método, caminho, form, json) com payloads realistas."""
+    quick = [q["text"] for q in app.get_quick_questions()]
+    contract = app.gerar_contrato_advocacia(long_contract_fields())
+    docx_title = "Contrato de Prestação de Serviços Advocatícios"
+    return {
+        "home_get": lambda i: ("GET", "/", None, None),
+        "home_post": lambda i: ("POST", "/", {"q": quick[i % len(quick)]}, None),
+        "qa_get": lambda i: ("GET", "/qa?" + urllib.parse.urlencode({"q": quick[i % len(quick)]}), None, None),
+        "qa_lote": lambda i: ("POST", "/qa/lote", None, {"questions": quick}),
+        "contrato_get": lambda i: ("GET", "/contrato", None, None),
+        "contrato_post": lambda i: ("POST", "/contrato", long_contract_fields(i), None),
+        # 20 variações: mistura de acertos e faltas no cache de DOCX.
+        "download_docx": lambda i: ("POST", "/download-docx", {
+            "doc_title": docx_title, "doc_text": f"{contract}\nAnexo {i % 20}", "doc_filename": "contrato",
+        }, None),
+        "recursos": lambda i: ("GET", "/recursos", None, None),
+    }
+
+
+def _run_inprocess(app, make, seconds: float) -> dict:
+    client = app.app.test_client()
+    lat, errors = [], 0
+    stop = time.time() + seconds
+    t_start = time.perf_counter()
+    i = 0
+    while time.time() < stop:
+        method, path, form, body = make(i)
+        t0 = time.perf_counter()
+        resp = client.open(path, method=method, data=form, json=body)
+        resp.get_data()
+        if resp.status_code >= 400:
+            errors += 1
+        else:
+            lat.append(time.perf_counter() - t0)
+        i += 1
+    return summarize(lat, time.perf_counter() - t_start, errors)
+
+
+def _run_http(base: str, make, clients: int, seconds: float) -> dict:
+    def request(n, i):
+        method, path, form, body = make(n * 1_000_000 + i)
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        elif body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        return urllib.request.Request(base + path, data=data, headers=headers, method=method)
+    return drive(request, None, clients, seconds)
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """Rotas com p95 pior ou vazão menor que a linha de base além do limite."""
+    regressions = []
+    if baseline.get("meta", {}).get("target") != result["meta"]["target"]:
+        print("aviso: linha de base medida com outro --target", file=sys.stderr)
+    for name, base in baseline.get("routes", {}).items():
+        cur = result["routes"].get(name)
+        if not cur or not base.get("requests"):
+            continue
+        if base["p95_ms"] and cur["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {cur['p95_ms']} ms")
+        if base["rps"] and cur["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{name}: vazão {base['rps']} -> {cur['rps']} req/s")
+    return regressions
+
+
+def bench_suite(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _import_app(tmp)
+        t0 = time.perf_counter()
+        seed_history(app, args.history_rows)
+        seed_s = time.perf_counter() - t0
+        routes = suite_routes(app)
+        selected = args.routes or list(routes)
+        result = {
+            "meta": {
+                "target": args.target,
+                "workers": args.workers if args.target == "gunicorn" else None,
+                "clients": args.clients if args.target == "gunicorn" else 1,
+                "seconds_por_rota": args.seconds,
+                "history_rows": args.history_rows,
+                "seed_s": round(seed_s, 1),
+                "python": sys.version.split()[0],
+                "env": args.env,
+            },
+            "routes": {},
+        }
+        if args.target == "gunicorn":
+            app.db().close()
+            with gunicorn_server(args.workers, tmp, args.env) as base:
+                for name in selected:
+                    result["routes"][name] = _run_http(base, routes[name], args.clients, args.seconds)
+        else:
+            for name in selected:
+                _run_inprocess(app, routes[name], min(1.0, args.seconds))  # aquece
+                result["routes"][name] = _run_inprocess(app, routes[name], args.seconds)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            result["regressoes"] = compare(result, json.load(f), args.threshold)
+    return result
+
+
+SCENARIOS = {
+    "home-post": bench_home_post,
+    "qa-index": bench_qa_index,
+    "docx": bench_docx,
+    "contrato-lote": bench_contrato_lote,
+    "contrato": bench_contrato,
+    "static-build": bench_static_build,
+    "qa-lote": bench_qa_lote,
+    "replay": bench_replay,
+    "history-storage": bench_history_storage,
+    "history-pages": bench_history_pages,
+    "history-search": bench_history_search,
+    "counters": bench_counters,
+    "history-export": bench_history_export,
+    "startup": bench_startup,
+    "async-load": bench_async_load,
+    "contention": bench_contention,
+    "suite": bench_suite,
+}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmarks do EthosJus")
+    ap.add_argument("scenario", choices=sorted(SCENARIOS))
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--entries", type=int, default=5000)
+    ap.add_argument("--iterations", type=int, default=50)
+    ap.add_argument("--rows", type=int, nargs="+", default=[10, 500, 5000],
+                    help="contrato-lote: tamanhos de lote; async-load: conexões simultâneas")
+    ap.add_argument("--batch", type=int, default=500, help="perguntas no cenário qa-lote")
+    ap.add_argument("--repeat", type=int, default=3, help="docx: cópias do contrato; startup: repetições")
+    ap.add_argument("--target", choices=["inprocess", "gunicorn"], default="inprocess",
+                    help="suite: test client do Flask ou gunicorn local")
+    ap.add_argument("--routes", nargs="+", help="suite: só estas rotas")
+    ap.add_argument("--worker-counts", type=int, nargs="+", default=[1, 2, 4, 8],
+                    help="contention: nº de workers do gunicorn a testar")
+    ap.add_argument("--write-ratio", type=float, default=0.2,
+                    help="contention: fração de requisições que gravam histórico")
+    ap.add_argument("--variant", action="append", metavar="NOME:CHAVE=VALOR,...",
+                    help="contention: configuração a comparar (repetível)")
+    ap.add_argument("--slow", type=int, default=0,
+                    help="async-load: conexões lentas abertas durante a carga")
+    ap.add_argument("--history-rows", type=int, default=1_000_000,
+                    help="suite/history-*: linhas pré-carregadas em qa_history")
+    ap.add_argument("--save", metavar="ARQ.json",
+                    help="suite: grava o resultado (linha de base); contention: grava o relatório")
+    ap.add_argument("--compare", metavar="ARQ.json", help="suite: compara com uma linha de base")
+    ap.add_argument("--threshold", type=float, default=0.2,
+                    help="suite: piora máxima tolerada (0.2 = 20%%) antes de falhar")
+    ap.add_argument("--env", action="append", default=[], metavar="CHAVE=VALOR",
+                    help="variável de ambiente repassada ao app (repetível)")
+    args = ap.parse_args(argv)
+    args.env = dict(kv.split("=", 1) for kv in args.env)
+    # Vale também para os cenários em processo (o app ainda não foi importado).
+    os.environ.update(args.env)
+    result = SCENARIOS[args.scenario](args)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if result.get("regressoes"):
+        print("REGRESSÃO:\n  " + "\n  ".join(result["regressoes"]), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
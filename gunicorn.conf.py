@@ -0,0 +1,41 @@
+# Configuração do gunicorn (lida automaticamente a partir deste diretório).
+#
+# preload_app: o app é importado uma vez no master e os workers nascem por
+# fork, já com módulos e templates compilados. O schema/migrações rodam uma
+# vez só, aqui, antes de qualquer worker existir.
+import os
+import sys
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+
+def _app():
+    if preload_app:
+        import app
+
+        return app
+    # Sem preload os workers (e o --reload) precisam importar o app do zero:
+    # o master usa uma cópia com outro nome, só para as métricas.
+    if "_ethosjus_master" not in sys.modules:
+        import importlib.util
+
+        spec = importlib.util.spec_from_file_location(
+            "_ethosjus_master", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    return sys.modules["_ethosjus_master"]
+
+
+def on_starting(server):
+    app = _app()
+    # Snapshots de métricas de uma execução anterior não entram na soma.
+    app.reset_metrics()
+    if preload_app:
+        app.ensure_db()
+        app.warm_up()
+
+
+def child_exit(server, worker):
+    # Contadores do worker que saiu vão para archived.json (ficam monótonos).
+    _app().archive_worker_metrics(worker.pid)